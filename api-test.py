@@ -1,11 +1,12 @@
 import requests
+import fetch
 import json
 from datetime import datetime
 
 def get_live_nfl_games():
     """Fetch live NFL games and their scores from ESPN API"""
     try:
-        response = requests.get("https://site.api.espn.com/apis/site/v2/sports/football/nfl/scoreboard")
+        response = fetch.get("https://site.api.espn.com/apis/site/v2/sports/football/nfl/scoreboard")
         response.raise_for_status()
         data = response.json()
         
@@ -148,7 +149,7 @@ if __name__ == "__main__":
     
     # Also fetch all data for summary and upcoming games
     try:
-        response = requests.get("https://site.api.espn.com/apis/site/v2/sports/football/nfl/scoreboard")
+        response = fetch.get("https://site.api.espn.com/apis/site/v2/sports/football/nfl/scoreboard")
         if response.status_code == 200:
             all_data = response.json()
             get_all_games_summary(all_data)
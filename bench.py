@@ -0,0 +1,221 @@
+"""Throughput benchmark for the e-Paper drivers.
+
+Runs every driver under drivers/ on the simulated SPI backend and
+measures, per panel:
+
+- getbuffer() time for a test image in the panel's own orientation and
+  rotated, the buffer size, and the peak Python memory allocated;
+- the SPI writes, bytes and commands of display() and Clear(), their CPU
+  time, and the time the driver spends in delays on the panel's behalf.
+
+    python bench.py -o bench.json                 # store a baseline
+    python bench.py --baseline bench.json         # compare against it
+    python bench.py epd2in13_V4 epd4in2 --format csv
+
+With --baseline the exit status is 1 if a panel got slower than the
+tolerance allows, or sends more writes, bytes or commands than before.
+"""
+
+import argparse
+import csv
+import glob
+import importlib
+import inspect
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+basedir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(basedir)
+from PIL import Image, ImageDraw
+
+from drivers import epdconfig, epdsim
+
+# Deterministic metrics, which regress on any increase
+COUNT_METRICS = ('bytes', 'writes', 'commands', 'panel_seconds')
+# Timings below this many seconds are too noisy to compare
+MIN_SECONDS = 0.001
+
+
+def test_image(width, height):
+    """Text, shapes, primary colours and a gray ramp, in RGB."""
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, width // 2, height // 4), fill='black')
+    draw.ellipse((width // 4, height // 4, width * 3 // 4, height // 2), fill='red', outline='black')
+    draw.rectangle((width // 2, 0, width - 1, height // 4), fill='yellow')
+    for i in range(8):
+        x = i * width // 8
+        draw.rectangle((x, height * 3 // 4, x + width // 8, height - 1), fill=(i * 255 // 7,) * 3)
+    for y in range(height // 2, height * 3 // 4, 12):
+        draw.text((2, y), "12:34 72F 5mph NW", fill='black')
+    return image
+
+
+def driver_names():
+    return sorted(os.path.basename(path)[:-3] for path in glob.glob(os.path.join(basedir, 'drivers', 'epd[0-9]*.py')))
+
+
+def find_method(epd, *names):
+    for name in names:
+        method = getattr(epd, name, None)
+        if method is not None:
+            return method
+    raise AttributeError("%s has none of %s" % (type(epd).__module__, ", ".join(names)))
+
+
+def call(method, epd, buf):
+    """Call a driver method, filling its required arguments by name."""
+    args = []
+    for param in inspect.signature(method).parameters.values():
+        if param.default is not param.empty or param.kind != param.POSITIONAL_OR_KEYWORD:
+            continue
+        name = param.name.lower()
+        if 'lut' in name:
+            args.append(epd.lut_full_update)
+        elif 'image' in name:
+            args.append(buf)
+        elif name == 'color':
+            args.append(0xFF)
+        elif name == 'update':
+            args.append(getattr(epd, 'FULL_UPDATE', 0))
+        else:
+            # mode and isPartial: 0 is the full refresh
+            args.append(0)
+    return method(*args)
+
+
+def time_getbuffer(epd, image, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        buf = epd.getbuffer(image)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        epd.getbuffer(image)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'seconds_min': min(times),
+        'seconds_median': statistics.median(times),
+        'bytes': len(buf),
+        'peak_bytes': peak,
+    }, buf
+
+
+def run_phase(sim, method, epd, buf):
+    sim.clear_log()
+    clock = sim.clock
+    start = time.perf_counter()
+    call(method, epd, buf)
+    return {
+        'seconds': time.perf_counter() - start,
+        'panel_seconds': sim.clock - clock,
+        'writes': sim.writes,
+        'bytes': sim.bytes_written,
+        'commands': sum(1 for command, _ in sim.log if command is not None),
+    }
+
+
+def bench_driver(name, repeat):
+    sim = epdsim.SimBackend()
+    epdconfig.set_backend(sim)
+    module = importlib.import_module('drivers.' + name)
+    epd = module.EPD()
+    result = {'module': name, 'width': epd.width, 'height': epd.height}
+    call(find_method(epd, 'init', 'Init'), epd, None)
+    result['getbuffer'] = {}
+    for orientation, size in (('native', (epd.width, epd.height)), ('rotated', (epd.height, epd.width))):
+        result['getbuffer'][orientation], buf = time_getbuffer(epd, test_image(*size), repeat)
+    result['display'] = run_phase(sim, find_method(epd, 'display', 'display_1Gray'), epd, buf)
+    result['clear'] = run_phase(sim, find_method(epd, 'Clear', 'clear'), epd, buf)
+    find_method(epd, 'sleep', 'Sleep')()
+    return result
+
+
+def flatten(result, prefix=''):
+    row = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            row.update(flatten(value, prefix + key + '.'))
+        else:
+            row[prefix + key] = value
+    return row
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing every regression against ``baseline``."""
+    old_rows = dict((r['module'], flatten(r)) for r in baseline['results'] if not r.get('error'))
+    regressions = []
+    for result in results:
+        old = old_rows.get(result['module'])
+        if old is None or result.get('error'):
+            continue
+        for key, value in sorted(flatten(result).items()):
+            before = old.get(key)
+            if not isinstance(value, (int, float)) or not isinstance(before, (int, float)):
+                continue
+            metric = key.rsplit('.', 1)[-1]
+            if metric in COUNT_METRICS and value > before:
+                regressions.append("%s %s: %g -> %g" % (result['module'], key, before, value))
+            elif (metric.startswith('seconds') and value > before * (1 + tolerance)
+                    and value - before > MIN_SECONDS):
+                regressions.append("%s %s: %.2fms -> %.2fms" % (result['module'], key, before * 1000, value * 1000))
+    return regressions
+
+
+def write_report(results, path, fmt):
+    out = open(path, 'w', newline='') if path else sys.stdout
+    try:
+        if fmt == 'json':
+            json.dump({'python': sys.version.split()[0], 'results': results}, out, indent=2)
+            out.write('\n')
+        else:
+            rows = [flatten(result) for result in results]
+            fields = []
+            for row in rows:
+                fields.extend(key for key in row if key not in fields)
+            writer = csv.DictWriter(out, fields)
+            writer.writeheader()
+            writer.writerows(rows)
+    finally:
+        if path:
+            out.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the e-Paper drivers on a simulated SPI bus.")
+    parser.add_argument('drivers', nargs='*', help="driver modules, e.g. epd2in13_V4 (default: all)")
+    parser.add_argument('-o', '--output', help="write the report here instead of stdout")
+    parser.add_argument('--format', choices=('json', 'csv'), default='json')
+    parser.add_argument('--repeat', type=int, default=5, help="getbuffer() runs per orientation")
+    parser.add_argument('--baseline', help="JSON report to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown against the baseline, as a fraction")
+    args = parser.parse_args(argv)
+
+    results = []
+    for name in args.drivers or driver_names():
+        try:
+            results.append(bench_driver(name, args.repeat))
+        except Exception as e:
+            results.append({'module': name, 'error': "%s: %s" % (type(e).__name__, e)})
+        print("%-16s %s" % (name, results[-1].get('error', 'ok')), file=sys.stderr)
+    write_report(results, args.output, args.format)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print("REGRESSION " + line, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
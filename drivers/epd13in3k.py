@@ -30,6 +30,8 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdcommand
 
 # Display resolution
 EPD_WIDTH       = 960
@@ -40,6 +42,97 @@ GRAY2  = 0xC0
 GRAY3  = 0x80 #gray
 GRAY4  = 0x00 #Blackest
 
+BUSY = epdcommand.BUSY
+
+# Waveform tables: 105 bytes of LUT for 0x32, then the gate (0x03),
+# source (0x04) and VCOM (0x2C) voltages
+LUT_PARTIAL = [
+    0x15,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,
+    0x2A,	0x88,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,
+    0x15,	0x44,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,
+    0x00,	0x08,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,
+    0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,
+    0x00,	0x01,	0x01,	0x01,	0x00,
+    0x0A,	0x00,	0x05,	0x00,	0x00,
+    0x00,	0x00,	0x00,	0x00,	0x00,
+    0x00,	0x00,	0x00,	0x00,	0x00,
+    0x00,	0x00,	0x00,	0x00,	0x00,
+    0x00,	0x00,	0x00,	0x00,	0x00,
+    0x00,	0x00,	0x00,	0x00,	0x00,
+    0x00,	0x00,	0x00,	0x00,	0x00,
+    0x00,	0x00,	0x00,	0x00,	0x00,
+    0x00,	0x00,	0x00,	0x01,	0x01,
+    0x22,	0x22,	0x22,	0x22,	0x22,
+    0x17,	0x41,	0xA8,	0x32,	0x18,
+    0x00,	0x00,
+]
+
+LUT_4GRAY = [
+    0x80,	0x48,	0x4A,	0x22,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,
+    0x0A,	0x48,	0x68,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,
+    0x88,	0x48,	0x60,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,
+    0xA8,	0x48,	0x45,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,
+    0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,
+    0x07,	0x23,	0x17,	0x02,	0x00,
+    0x05,	0x01,	0x05,	0x01,	0x02,
+    0x08,	0x02,	0x01,	0x04,	0x04,
+    0x00,	0x02,	0x00,	0x02,	0x01,
+    0x00,	0x00,	0x00,	0x00,	0x00,
+    0x00,	0x00,	0x00,	0x00,	0x00,
+    0x00,	0x00,	0x00,	0x00,	0x00,
+    0x00,	0x00,	0x00,	0x00,	0x00,
+    0x00,	0x00,	0x00,	0x00,	0x00,
+    0x00,	0x00,	0x00,	0x00,	0x01,
+    0x22,	0x22,	0x22,	0x22,	0x22,
+    0x17,	0x41,	0xA8,	0x32,	0x30,
+    0x00,	0x00,
+]
+
+
+def lut_sequence(lut):
+    return epdcommand.compile_sequence([
+        (0x32, lut[:105]),
+        (0x03, lut[105:106]),
+        (0x04, lut[106:109]),
+        (0x2C, lut[109:110]),
+    ])
+
+
+def setup_sequence(border):
+    """Controller setup after the hardware reset, for a 0x3C border value."""
+    return epdcommand.compile_sequence([
+        BUSY,
+        (0x12, []),                             # SWRESET
+        BUSY,
+        (0x0C, [0xAE, 0xC7, 0xC3, 0xC0, 0x80]),
+        (0x01, [0xA7, 0x02, 0x00]),
+        (0x11, [0x03]),
+        (0x44, [0x00, 0x00, 0xBF, 0x03]),
+        (0x45, [0x00, 0x00, 0xA7, 0x02]),
+        (0x3C, [border]),
+        (0x18, [0x80]),
+        (0x4E, [0x00, 0x00]),
+        (0x4F, [0x00, 0x00]),
+    ])
+
+
+INIT_SEQUENCE = setup_sequence(0x05)
+INIT_4GRAY_SEQUENCE = setup_sequence(0x00) + lut_sequence(LUT_4GRAY) + [BUSY]
+INIT_PART_SEQUENCE = epdcommand.compile_sequence([
+    (0x3C, [0x80]),
+] + lut_sequence(LUT_PARTIAL) + [
+    (0x37, [0x00, 0x00, 0x00, 0x00, 0x00, 0x40, 0x00, 0x00, 0x00, 0x00]),
+    (0x3C, [0x80]),
+    (0x22, [0xC0]),
+    (0x20, []),
+    BUSY,
+])
+
+# Display Update Control options for full, partial and 4-gray refresh
+UPDATE_SEQUENCE = epdcommand.compile_sequence([(0x22, [0xF7]), (0x20, []), BUSY])
+UPDATE_PART_SEQUENCE = epdcommand.compile_sequence([(0x22, [0xCF]), (0x20, []), BUSY])
+UPDATE_4GRAY_SEQUENCE = epdcommand.compile_sequence([(0x22, [0xC7]), (0x20, []), BUSY])
+
 logger = logging.getLogger(__name__)
 
 class EPD:
@@ -55,45 +148,8 @@ class EPD:
         self.GRAY3  = GRAY3 #gray
         self.GRAY4  = GRAY4 #Blackest
 
-        self.Lut_Partial=[									
-            0x15,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	
-            0x2A,	0x88,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	
-            0x15,	0x44,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	
-            0x00,	0x08,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	
-            0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	
-            0x00,	0x01,	0x01,	0x01,	0x00,						
-            0x0A,	0x00,	0x05,	0x00,	0x00,						
-            0x00,	0x00,	0x00,	0x00,	0x00,						
-            0x00,	0x00,	0x00,	0x00,	0x00,						
-            0x00,	0x00,	0x00,	0x00,	0x00,						
-            0x00,	0x00,	0x00,	0x00,	0x00,						
-            0x00,	0x00,	0x00,	0x00,	0x00,						
-            0x00,	0x00,	0x00,	0x00,	0x00,						
-            0x00,	0x00,	0x00,	0x00,	0x00,						
-            0x00,	0x00,	0x00,	0x01,	0x01,						
-            0x22,	0x22,	0x22,	0x22,	0x22,						
-            0x17,	0x41,	0xA8,	0x32,	0x18,						
-            0x00,	0x00,]
-
-        self.LUT_DATA_4Gray =[											
-            0x80,	0x48,	0x4A,	0x22,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	
-            0x0A,	0x48,	0x68,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	
-            0x88,	0x48,	0x60,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	
-            0xA8,	0x48,	0x45,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	
-            0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	0x00,	
-            0x07,	0x23,	0x17,	0x02,	0x00,						
-            0x05,	0x01,	0x05,	0x01,	0x02,						
-            0x08,	0x02,	0x01,	0x04,	0x04,						
-            0x00,	0x02,	0x00,	0x02,	0x01,						
-            0x00,	0x00,	0x00,	0x00,	0x00,						
-            0x00,	0x00,	0x00,	0x00,	0x00,						
-            0x00,	0x00,	0x00,	0x00,	0x00,						
-            0x00,	0x00,	0x00,	0x00,	0x00,						
-            0x00,	0x00,	0x00,	0x00,	0x00,						
-            0x00,	0x00,	0x00,	0x00,	0x01,						
-            0x22,	0x22,	0x22,	0x22,	0x22,						
-            0x17,	0x41,	0xA8,	0x32,	0x30,						
-            0x00,	0x00,]
+        self.Lut_Partial = LUT_PARTIAL
+        self.LUT_DATA_4Gray = LUT_4GRAY
 
         if (epdconfig.module_init() != 0):
             return -1
@@ -122,248 +178,52 @@ class EPD:
     def send_data2(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.SPI.writebytes2(data)
+        epdconfig.spi_writebyte2(data)
         epdconfig.digital_write(self.cs_pin, 1)
 
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        busy = epdconfig.digital_read(self.busy_pin)
-        while(busy == 1):
-            busy = epdconfig.digital_read(self.busy_pin)
-            epdconfig.delay_ms(20)
+        epdconfig.wait_for_idle(self.busy_pin, 1)
         epdconfig.delay_ms(20)
         logger.debug("e-Paper busy release")
 
     def TurnOnDisplay(self):
-        self.send_command(0x22) #Display Update Control
-        self.send_data(0xF7)
-        self.send_command(0x20) #Activate Display Update Sequence
-        self.ReadBusy()
+        epdcommand.send_sequence(self, UPDATE_SEQUENCE)
 
     def TurnOnDisplay_Part(self):
-        self.send_command(0x22) #Display Update Control
-        self.send_data(0xCF)
-        self.send_command(0x20) #Activate Display Update Sequence
-        self.ReadBusy()
+        epdcommand.send_sequence(self, UPDATE_PART_SEQUENCE)
 
     def TurnOnDisplay_4GRAY(self):
-        self.send_command(0x22) #Display Update Control
-        self.send_data(0xC7)
-        self.send_command(0x20) #Activate Display Update Sequence
-        self.ReadBusy()
+        epdcommand.send_sequence(self, UPDATE_4GRAY_SEQUENCE)
 
     def Lut(self, LUT):
-        self.send_command(0x32)
-        for i in range(105):
-            self.send_data(LUT[i])
-
-        self.send_command(0x03) 
-        self.send_data(LUT[105])
-
-        self.send_command(0x04)  
-        self.send_data(LUT[106])
-        self.send_data(LUT[107]) 
-        self.send_data(LUT[108])
-
-        self.send_command(0x2C)
-        self.send_data(LUT[109])
+        epdcommand.send_sequence(self, lut_sequence(LUT))
         
     def init(self):
         
         # EPD hardware init start
         self.reset()
-        self.ReadBusy()
-
-        self.send_command(0x12) #SWRESET
-        self.ReadBusy()
-
-        self.send_command(0x0C) 
-        self.send_data(0xAE)
-        self.send_data(0xC7)  
-        self.send_data(0xC3)
-        self.send_data(0xC0)
-        self.send_data(0x80)
-
-        self.send_command(0x01) 
-        self.send_data(0xA7)
-        self.send_data(0x02)  
-        self.send_data(0x00)
-
-        self.send_command(0x11)
-        self.send_data(0x03)
-
-        self.send_command(0x44) 
-        self.send_data(0x00)
-        self.send_data(0x00)  
-        self.send_data(0xBF)
-        self.send_data(0x03) 
-        
-        self.send_command(0x45) 
-        self.send_data(0x00)
-        self.send_data(0x00)  
-        self.send_data(0xA7)
-        self.send_data(0x02)
-
-        self.send_command(0x3C) 
-        self.send_data(0x05)
-
-        self.send_command(0x18) 
-        self.send_data(0x80)
-
-        self.send_command(0x4E) 
-        self.send_data(0x00)
-        self.send_data(0x00)
-
-        self.send_command(0x4F) 
-        self.send_data(0x00)
-        self.send_data(0x00) 
-
+        epdcommand.send_sequence(self, INIT_SEQUENCE)
         # EPD hardware init end
         return 0
 
     def init_Part(self):
         self.reset()
+        epdcommand.send_sequence(self, INIT_PART_SEQUENCE)
 
-        self.send_command(0x3C)    
-        self.send_data(0x80)
-
-        self.Lut(self.Lut_Partial)
-
-        self.send_command(0x37) 
-        self.send_data(0x00)  
-        self.send_data(0x00)  
-        self.send_data(0x00)  
-        self.send_data(0x00)  
-        self.send_data(0x00) 
-        self.send_data(0x40)  
-        self.send_data(0x00)  
-        self.send_data(0x00)   
-        self.send_data(0x00)  
-        self.send_data(0x00)  
-
-        self.send_command(0x3C) 
-        self.send_data(0x80)   
-
-        self.send_command(0x22) 
-        self.send_data(0xC0)   
-        self.send_command(0x20) 
-
-        self.ReadBusy()
     def init_4GRAY(self):
         self.reset()
-
-        self.ReadBusy()   
-        self.send_command(0x12)
-        self.ReadBusy()   
-
-        self.send_command(0x0C)   
-        self.send_data(0xAE)
-        self.send_data(0xC7)
-        self.send_data(0xC3)
-        self.send_data(0xC0)
-        self.send_data(0x80)
-
-        self.send_command(0x01) 
-        self.send_data(0xA7)
-        self.send_data(0x02)  
-        self.send_data(0x00)
-
-        self.send_command(0x11)
-        self.send_data(0x03) 
-
-        self.send_command(0x44) 
-        self.send_data(0x00)
-        self.send_data(0x00)  
-        self.send_data(0xBF)
-        self.send_data(0x03) 
-        
-        self.send_command(0x45) 
-        self.send_data(0x00)
-        self.send_data(0x00)  
-        self.send_data(0xA7)
-        self.send_data(0x02)
-
-        self.send_command(0x3C)
-        self.send_data(0x00)
-
-        self.send_command(0x18) 
-        self.send_data(0x80)
-        
-        self.send_command(0x4E) 
-        self.send_data(0x00)
-        self.send_data(0x00)
-
-        self.send_command(0x4F) 
-        self.send_data(0x00)
-        self.send_data(0x00) 
-
-        self.Lut(self.LUT_DATA_4Gray)
-        
-        self.ReadBusy()
+        epdcommand.send_sequence(self, INIT_4GRAY_SEQUENCE)
 
 
     def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if imwidth == self.width and imheight == self.height:
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif imwidth == self.height and imheight == self.width:
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy * self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.pack_1bpp(image, self.width, self.height)
 
     def getbuffer_4Gray(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 4) * self.height)
-        image_monocolor = image.convert('L')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        i=0
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((x + (y * self.width))/4)] = ((pixels[x-3, y]&0xc0) | (pixels[x-2, y]&0xc0)>>2 | (pixels[x-1, y]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6)
-                        
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for x in range(imwidth):
-                for y in range(imheight):
-                    newx = y
-                    newy = self.height - x - 1
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((newx + (newy * self.width))/4)] = ((pixels[x, y-3]&0xc0) | (pixels[x, y-2]&0xc0)>>2 | (pixels[x, y-1]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6) 
-        return buf
+        return epdbuffer.pack_4gray(image, self.width, self.height)
 
     def Clear(self):
-        buf = [0xFF] * (int(self.width/8) * self.height)
+        buf = epdbuffer.solid(0xFF, int(self.width/8) * self.height)
         self.send_command(0x24)
         self.send_data2(buf)
 
@@ -391,14 +251,10 @@ class EPD:
             Width = self.width // 8 +1
         Height = self.height
         self.send_command(0x24)   #Write Black and White image to RAM
-        for j in range(Height):
-            for i in range(Width):
-                self.send_data(color)
+        self.send_data2(epdbuffer.solid(color, Width * Height))
                 
         self.send_command(0x26)  #Write Black and White image to RAM
-        for j in range(Height):
-            for i in range(Width):
-                self.send_data(color)
+        self.send_data2(epdbuffer.solid(color, Width * Height))
         # self.TurnOnDisplay()
 
     def display_Partial(self, Image, Xstart, Ystart, Xend, Yend):
@@ -440,77 +296,18 @@ class EPD:
         self.send_data((Ystart>>8) & 0x01)
 
         self.send_command(0x24)  
-        for j in range(Height):
-            for i in range(Width):
-                if((j > Ystart-1) & (j < (Yend + 1)) & (i > Xstart-1) & (i < (Xend + 1))):
-                    self.send_data(Image[i + j * Width])
+        self.send_data2(epdbuffer.crop(Image, Width, Xstart, Ystart, Xend + 1, Yend + 1))
         self.TurnOnDisplay_Part()
     
     def display_4Gray(self, image):
+        # RAM bits for black, gray2, gray1 and white
+        plane1, plane2 = epdbuffer.split_4gray(image, self.width, self.height, (1, 0, 1, 0), (1, 1, 0, 0))
         self.send_command(0x24)
-        for i in range(0, 81600): 
-            temp3=0
-            for j in range(0, 2):
-                temp1 = image[i*2+j]
-                for k in range(0, 2):
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):
-                        temp3 |= 0x00
-                    elif(temp2 == 0x00):
-                        temp3 |= 0x01  
-                    elif(temp2 == 0x80): 
-                        temp3 |= 0x01 
-                    else: #0x40
-                        temp3 |= 0x00 
-                    temp3 <<= 1	
-                    
-                    temp1 <<= 2
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0): 
-                        temp3 |= 0x00
-                    elif(temp2 == 0x00): 
-                        temp3 |= 0x01
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x01
-                    else :   #0x40
-                        temp3 |= 0x00	
-                    if(j!=1 or k!=1):				
-                        temp3 <<= 1
-                    temp1 <<= 2
-            self.send_data(temp3)
-            
-        self.send_command(0x26)	       
-        for i in range(0, 81600): 
-            temp3=0
-            for j in range(0, 2):
-                temp1 = image[i*2+j]
-                for k in range(0, 2):
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):
-                        temp3 |= 0x00
-                    elif(temp2 == 0x00):
-                        temp3 |= 0x01
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x00
-                    else: #0x40
-                        temp3 |= 0x01 
-                    temp3 <<= 1	
-                    
-                    temp1 <<= 2
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0): 
-                        temp3 |= 0x00
-                    elif(temp2 == 0x00): 
-                        temp3 |= 0x01
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x00 
-                    else:    #0x40
-                            temp3 |= 0x01	
-                    if(j!=1 or k!=1):					
-                        temp3 <<= 1
-                    temp1 <<= 2
-            self.send_data(temp3)
-        
+        self.send_data2(plane1)
+
+        self.send_command(0x26)
+        self.send_data2(plane2)
+
         self.TurnOnDisplay_4GRAY()
 
 
@@ -518,6 +315,5 @@ class EPD:
         self.send_command(0x10) # DEEP_SLEEP
         self.send_data(0x03)
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_standby(2000)
 ### END OF FILE ###
@@ -30,11 +30,30 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdcommand
 
 # Display resolution
 EPD_WIDTH       = 122
 EPD_HEIGHT      = 250
 
+# Controller setup sent by init() before the LUT
+INIT_SEQUENCE = epdcommand.compile_sequence([
+    (0x01, [(EPD_HEIGHT - 1) & 0xFF, ((EPD_HEIGHT - 1) >> 8) & 0xFF, 0x00]),  # DRIVER_OUTPUT_CONTROL, GD = 0 SM = 0 TB = 0
+    (0x0C, [0xD7, 0xD6, 0x9D]),         # BOOSTER_SOFT_START_CONTROL
+    (0x2C, [0xA8]),                     # WRITE_VCOM_REGISTER, VCOM 7C
+    (0x3A, [0x1A]),                     # SET_DUMMY_LINE_PERIOD, 4 dummy lines per gate
+    (0x3B, [0x08]),                     # SET_GATE_TIME, 2us per line
+    (0X3C, [0x03]),                     # BORDER_WAVEFORM_CONTROL
+    (0X11, [0x03]),                     # DATA_ENTRY_MODE_SETTING, X increment; Y increment
+])
+
+UPDATE_SEQUENCE = epdcommand.compile_sequence([
+    (0x22, [0xC4]),                     # DISPLAY_UPDATE_CONTROL_2
+    (0x20, []),                         # MASTER_ACTIVATION
+    (0xFF, []),                         # TERMINATE_FRAME_READ_WRITE
+])
+
 logger = logging.getLogger(__name__)
 
 class EPD:
@@ -80,16 +99,19 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a lot of data
+    def send_data2(self, data):
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
         
     def ReadBusy(self):        
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(100)            
+        epdconfig.wait_for_idle(self.busy_pin, 1)
 
     def TurnOnDisplay(self):
-        self.send_command(0x22) # DISPLAY_UPDATE_CONTROL_2
-        self.send_data(0xC4)
-        self.send_command(0x20) # MASTER_ACTIVATION
-        self.send_command(0xFF) # TERMINATE_FRAME_READ_WRITE
+        epdcommand.send_sequence(self, UPDATE_SEQUENCE)
         
         logger.debug("e-Paper busy")
         self.ReadBusy()
@@ -100,91 +122,22 @@ class EPD:
             return -1
         # EPD hardware init start
         self.reset()
-        self.send_command(0x01) # DRIVER_OUTPUT_CONTROL
-        self.send_data((EPD_HEIGHT - 1) & 0xFF)
-        self.send_data(((EPD_HEIGHT - 1) >> 8) & 0xFF)
-        self.send_data(0x00) # GD = 0 SM = 0 TB = 0
-        
-        self.send_command(0x0C) # BOOSTER_SOFT_START_CONTROL
-        self.send_data(0xD7)
-        self.send_data(0xD6)
-        self.send_data(0x9D)
-        
-        self.send_command(0x2C) # WRITE_VCOM_REGISTER
-        self.send_data(0xA8) # VCOM 7C
-        
-        self.send_command(0x3A) # SET_DUMMY_LINE_PERIOD
-        self.send_data(0x1A) # 4 dummy lines per gate
-        
-        self.send_command(0x3B) # SET_GATE_TIME
-        self.send_data(0x08) # 2us per line
-        
-        self.send_command(0X3C) # BORDER_WAVEFORM_CONTROL
-        self.send_data(0x03)      
-        
-        self.send_command(0X11) # DATA_ENTRY_MODE_SETTING
-        self.send_data(0x03) # X increment; Y increment
+        epdcommand.send_sequence(self, INIT_SEQUENCE)
         
         # WRITE_LUT_REGISTER
         self.send_command(0x32)
-        for count in range(30):
-            self.send_data(lut[count])
+        self.send_data2(bytes(lut[:30]))
 
         return 0
-        
-##
- #  @brief: specify the memory area for data R/W
- ##
     def SetWindows(self, x_start, y_start, x_end, y_end):
-        self.send_command(0x44) # SET_RAM_X_ADDRESS_START_END_POSITION
-        self.send_data((x_start >> 3) & 0xFF)
-        self.send_data((x_end >> 3) & 0xFF)
-        self.send_command(0x45) # SET_RAM_Y_ADDRESS_START_END_POSITION
-        self.send_data(y_start & 0xFF)
-        self.send_data((y_start >> 8) & 0xFF)
-        self.send_data(y_end & 0xFF)
-        self.send_data((y_end >> 8) & 0xFF)
-
-##
- #  @brief: specify the start point for data R/W
- ##
+        epdcommand.send_sequence(self, epdcommand.ssd_window(x_start, y_start, x_end, y_end))
     def SetCursor(self, x, y):
-        self.send_command(0x4E) # SET_RAM_X_ADDRESS_COUNTER
         # x point must be the multiple of 8 or the last 3 bits will be ignored
-        self.send_data((x >> 3) & 0xFF)
-        self.send_command(0x4F) # SET_RAM_Y_ADDRESS_COUNTER
-        self.send_data(y & 0xFF)
-        self.send_data((y >> 8) & 0xFF)
+        epdcommand.send_sequence(self, epdcommand.ssd_cursor(x >> 3, y))
         self.ReadBusy()
         
     def getbuffer(self, image):
-        if self.width%8 == 0:
-            linewidth = int(self.width/8)
-        else:
-            linewidth = int(self.width/8) + 1
-         
-        buf = [0xFF] * (linewidth * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):                    
-                    if pixels[x, y] == 0:
-                        # x = imwidth - x
-                        buf[int(x / 8) + y * linewidth] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        # newy = imwidth - newy - 1
-                        buf[int(newx / 8) + newy*linewidth] &= ~(0x80 >> (y % 8))
-        return buf   
+        return epdbuffer.pack_1bpp(image, self.width, self.height)
 
         
     def display(self, image):
@@ -193,12 +146,11 @@ class EPD:
         else:
             linewidth = int(self.width/8) + 1
 
+        # the window is linewidth bytes wide, so one write fills every row
         self.SetWindows(0, 0, self.width, self.height);
-        for j in range(0, self.height):
-            self.SetCursor(0, j);
-            self.send_command(0x24);
-            for i in range(0, linewidth):
-                self.send_data(image[i + j * linewidth])   
+        self.SetCursor(0, 0);
+        self.send_command(0x24);
+        self.send_data2(image[:linewidth * self.height])
         self.TurnOnDisplay()
     
     def Clear(self, color=0xFF):
@@ -208,11 +160,9 @@ class EPD:
             linewidth = int(self.width/8) + 1
 
         self.SetWindows(0, 0, self.width, self.height);
-        for j in range(0, self.height):
-            self.SetCursor(0, j);
-            self.send_command(0x24);
-            for i in range(0, linewidth):
-                self.send_data(color)   
+        self.SetCursor(0, 0);
+        self.send_command(0x24);
+        self.send_data2(epdbuffer.solid(color, linewidth * self.height))
         self.TurnOnDisplay()
 
     def sleep(self):
@@ -220,8 +170,7 @@ class EPD:
         self.send_data(0x01)
         epdconfig.delay_ms(100)
          
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_standby(2000)
         
 ### END OF FILE ###
 
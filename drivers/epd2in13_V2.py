@@ -30,6 +30,8 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from PIL import Image
 
 # Display resolution
 EPD_WIDTH       = 122
@@ -113,8 +115,7 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 1)
         
     def ReadBusy(self):
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(100)    
+        epdconfig.wait_for_idle(self.busy_pin, 1)
 
     def TurnOnDisplay(self):
         self.send_command(0x22)
@@ -181,8 +182,7 @@ class EPD:
             self.send_data(self.lut_full_update[75])
 
             self.send_command(0x32)
-            for count in range(70):
-                self.send_data(self.lut_full_update[count])
+            self.send_data2(self.lut_full_update[:70])
 
             self.send_command(0x4E)   # set RAM x address count to 0
             self.send_data(0x00)
@@ -197,8 +197,7 @@ class EPD:
             self.ReadBusy()
 
             self.send_command(0x32)
-            for count in range(70):
-                self.send_data(self.lut_partial_update[count])
+            self.send_data2(self.lut_partial_update[:70])
 
             self.send_command(0x37)
             self.send_data(0x00)
@@ -219,33 +218,13 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        if self.width%8 == 0:
-            linewidth = int(self.width/8)
-        else:
-            linewidth = int(self.width/8) + 1
-         
-        buf = [0xFF] * (linewidth * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        
-        if(imwidth == self.width and imheight == self.height):
+        if image.size == (self.width, self.height):
             logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):                    
-                    if pixels[x, y] == 0:
-                        x = imwidth - x
-                        buf[int(x / 8) + y * linewidth] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        newy = imwidth - newy - 1
-                        buf[int(newx / 8) + newy*linewidth] &= ~(0x80 >> (y % 8))
-        return buf   
+            # the RAM is mirrored on this panel, one pixel to the right
+            img = Image.new('1', (epdbuffer.linewidth(self.width) * 8, self.height), 255)
+            img.paste(image.convert('1').transpose(Image.FLIP_LEFT_RIGHT), (1, 0))
+            return bytearray(img.tobytes('raw'))
+        return epdbuffer.pack_1bpp(image, self.width, self.height, transpose=epdbuffer.TRANSPOSE)
         
         
     def display(self, image):
@@ -259,10 +238,7 @@ class EPD:
         else:
             linewidth = int(self.width/8) + 1
 
-        buf = [0x00] * self.height * linewidth
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                buf[i + j * linewidth] = ~image[i + j * linewidth]
+        buf = epdbuffer.invert(image)
 
         self.send_command(0x24)
         self.send_data2(image)   
@@ -287,10 +263,7 @@ class EPD:
             linewidth = int(self.width/8) + 1
         # logger.debug(linewidth)
         
-        buf = [0x00] * self.height * linewidth
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                buf[i + j * linewidth] = color
+        buf = epdbuffer.solid(color, self.height * linewidth)
 
         self.send_command(0x24)
         self.send_data2(buf)
@@ -309,8 +282,7 @@ class EPD:
 
         self.send_command(0x10) #enter deep sleep
         self.send_data(0x03)
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_standby(2000)
 
 ### END OF FILE ###
 
@@ -30,11 +30,59 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdcommand
 
 # Display resolution
 EPD_WIDTH       = 122
 EPD_HEIGHT      = 250
 
+BUSY = epdcommand.BUSY
+FULL_WINDOW = epdcommand.ssd_window(0, 0, EPD_WIDTH - 1, EPD_HEIGHT - 1) + epdcommand.ssd_cursor(0, 0)
+
+# Controller setup sent by init() after the hardware reset
+INIT_SEQUENCE = [
+    BUSY,
+    (0x12, b''),                # SWRESET
+    BUSY,
+    (0x01, b'\xf9\x00\x00'),    # Driver output control
+    (0x11, b'\x03'),            # data entry mode
+] + FULL_WINDOW + [
+    (0x3c, b'\x05'),            # BorderWavefrom
+    (0x21, b'\x00\x80'),        # Display update control
+    (0x18, b'\x80'),            # Read built-in temperature sensor
+    BUSY,
+]
+
+# init_fast(): load a fixed temperature so the fast waveform is used
+INIT_FAST_SEQUENCE = [
+    (0x12, b''),                # SWRESET
+    BUSY,
+    (0x18, b''),                # Read built-in temperature sensor
+    (0x80, b''),
+    (0x11, b'\x03'),            # data entry mode
+] + FULL_WINDOW + [
+    (0x22, b'\xb1'),            # Load temperature value
+    (0x20, b''),
+    BUSY,
+    (0x1A, b'\x64\x00'),        # Write to temperature register
+    (0x22, b'\x91'),            # Load temperature value
+    (0x20, b''),
+    BUSY,
+]
+
+# displayPartial(): setup after the short reset pulse
+PARTIAL_SEQUENCE = [
+    (0x3C, b'\x80'),            # BorderWavefrom
+    (0x01, b'\xF9\x00\x00'),    # Driver output control
+    (0x11, b'\x03'),            # data entry mode
+] + FULL_WINDOW
+
+# Display Update Control options: full, fast and partial refresh
+UPDATE_SEQUENCE = [(0x22, b'\xf7'), (0x20, b''), BUSY]
+UPDATE_FAST_SEQUENCE = [(0x22, b'\xC7'), (0x20, b''), BUSY]
+UPDATE_PART_SEQUENCE = [(0x22, b'\xff'), (0x20, b''), BUSY]
+
 logger = logging.getLogger(__name__)
 
 class EPD:
@@ -93,8 +141,7 @@ class EPD:
     '''
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(10)  
+        epdconfig.wait_for_idle(self.busy_pin, 1)
         logger.debug("e-Paper busy release")
 
     '''
@@ -102,30 +149,21 @@ class EPD:
     parameter:
     '''
     def TurnOnDisplay(self):
-        self.send_command(0x22) # Display Update Control
-        self.send_data(0xf7)
-        self.send_command(0x20) # Activate Display Update Sequence
-        self.ReadBusy()
+        epdcommand.send_sequence(self, UPDATE_SEQUENCE)
 
     '''
     function : Turn On Display Fast
     parameter:
     '''
     def TurnOnDisplay_Fast(self):
-        self.send_command(0x22) # Display Update Control
-        self.send_data(0xC7)    # fast:0x0c, quality:0x0f, 0xcf
-        self.send_command(0x20) # Activate Display Update Sequence
-        self.ReadBusy()
+        epdcommand.send_sequence(self, UPDATE_FAST_SEQUENCE)
     
     '''
     function : Turn On Display Part
     parameter:
     '''
     def TurnOnDisplayPart(self):
-        self.send_command(0x22) # Display Update Control
-        self.send_data(0xff)    # fast:0x0c, quality:0x0f, 0xcf
-        self.send_command(0x20) # Activate Display Update Sequence
-        self.ReadBusy()
+        epdcommand.send_sequence(self, UPDATE_PART_SEQUENCE)
 
 
     '''
@@ -137,16 +175,8 @@ class EPD:
         yend : End position of Y-axis
     '''
     def SetWindow(self, x_start, y_start, x_end, y_end):
-        self.send_command(0x44) # SET_RAM_X_ADDRESS_START_END_POSITION
         # x point must be the multiple of 8 or the last 3 bits will be ignored
-        self.send_data((x_start>>3) & 0xFF)
-        self.send_data((x_end>>3) & 0xFF)
-        
-        self.send_command(0x45) # SET_RAM_Y_ADDRESS_START_END_POSITION
-        self.send_data(y_start & 0xFF)
-        self.send_data((y_start >> 8) & 0xFF)
-        self.send_data(y_end & 0xFF)
-        self.send_data((y_end >> 8) & 0xFF)
+        epdcommand.send_sequence(self, epdcommand.ssd_window(x_start, y_start, x_end, y_end))
 
     '''
     function : Set Cursor
@@ -155,13 +185,7 @@ class EPD:
         y : Y-axis starting position
     '''
     def SetCursor(self, x, y):
-        self.send_command(0x4E) # SET_RAM_X_ADDRESS_COUNTER
-        # x point must be the multiple of 8 or the last 3 bits will be ignored
-        self.send_data(x & 0xFF)
-        
-        self.send_command(0x4F) # SET_RAM_Y_ADDRESS_COUNTER
-        self.send_data(y & 0xFF)
-        self.send_data((y >> 8) & 0xFF)
+        epdcommand.send_sequence(self, epdcommand.ssd_cursor(x, y))
     
     '''
     function : Initialize the e-Paper register
@@ -172,34 +196,7 @@ class EPD:
             return -1
         # EPD hardware init start
         self.reset()
-        
-        self.ReadBusy()
-        self.send_command(0x12)  #SWRESET
-        self.ReadBusy() 
-
-        self.send_command(0x01) #Driver output control      
-        self.send_data(0xf9)
-        self.send_data(0x00)
-        self.send_data(0x00)
-    
-        self.send_command(0x11) #data entry mode       
-        self.send_data(0x03)
-
-        self.SetWindow(0, 0, self.width-1, self.height-1)
-        self.SetCursor(0, 0)
-        
-        self.send_command(0x3c)
-        self.send_data(0x05)
-
-        self.send_command(0x21) #  Display update control
-        self.send_data(0x00)
-        self.send_data(0x80)
-    
-        self.send_command(0x18)
-        self.send_data(0x80)
-        
-        self.ReadBusy()
-        
+        epdcommand.send_sequence(self, INIT_SEQUENCE)
         return 0
 
     '''
@@ -211,33 +208,7 @@ class EPD:
             return -1
         # EPD hardware init start
         self.reset()
-
-        self.send_command(0x12)  #SWRESET
-        self.ReadBusy() 
-
-        self.send_command(0x18) # Read built-in temperature sensor
-        self.send_command(0x80)
-
-        self.send_command(0x11) # data entry mode       
-        self.send_data(0x03)    
-
-        self.SetWindow(0, 0, self.width-1, self.height-1)
-        self.SetCursor(0, 0)
-        
-        self.send_command(0x22) # Load temperature value
-        self.send_data(0xB1)	
-        self.send_command(0x20)
-        self.ReadBusy()
-
-        self.send_command(0x1A) # Write to temperature register
-        self.send_data(0x64)
-        self.send_data(0x00)
-                        
-        self.send_command(0x22) # Load temperature value
-        self.send_data(0x91)	
-        self.send_command(0x20)
-        self.ReadBusy()
-        
+        epdcommand.send_sequence(self, INIT_FAST_SEQUENCE)
         return 0
     '''
     function : Display images
@@ -245,20 +216,7 @@ class EPD:
         image : Image data
     '''
     def getbuffer(self, image):
-        img = image
-        imwidth, imheight = img.size
-        if(imwidth == self.width and imheight == self.height):
-            img = img.convert('1')
-        elif(imwidth == self.height and imheight == self.width):
-            # image has correct dimensions, but needs to be rotated
-            img = img.rotate(90, expand=True).convert('1')
-        else:
-            logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
-            # return a blank buffer
-            return [0x00] * (int(self.width/8) * self.height)
-
-        buf = bytearray(img.tobytes('raw'))
-        return buf
+        return epdbuffer.pack_1bpp(image, self.width, self.height, fill=0x00, rotate_first=True)
         
     '''
     function : Sends the image buffer in RAM to e-Paper and displays
@@ -283,26 +241,20 @@ class EPD:
     function : Sends the image buffer in RAM to e-Paper and partial refresh
     parameter:
         image : Image data
+        base : Previous image data, reloaded when the RAM was lost in sleep
     '''
-    def displayPartial(self, image):
+    def displayPartial(self, image, base=None):
         epdconfig.digital_write(self.reset_pin, 0)
         epdconfig.delay_ms(1)
         epdconfig.digital_write(self.reset_pin, 1)  
 
-        self.send_command(0x3C) # BorderWavefrom
-        self.send_data(0x80)
-
-        self.send_command(0x01) # Driver output control      
-        self.send_data(0xF9) 
-        self.send_data(0x00)
-        self.send_data(0x00)
+        epdcommand.send_sequence(self, PARTIAL_SEQUENCE)
 
-        self.send_command(0x11) # data entry mode       
-        self.send_data(0x03)
+        if base is not None:
+            self.send_command(0x26) # old image the partial waveform diffs against
+            self.send_data2(base)
+            self.SetCursor(0, 0)
 
-        self.SetWindow(0, 0, self.width - 1, self.height - 1)
-        self.SetCursor(0, 0)
-        
         self.send_command(0x24) # WRITE_RAM
         self.send_data2(image)  
         self.TurnOnDisplayPart()
@@ -332,7 +284,7 @@ class EPD:
         # logger.debug(linewidth)
         
         self.send_command(0x24)
-        self.send_data2([color] * int(self.height * linewidth))  
+        self.send_data2(epdbuffer.solid(color, int(self.height * linewidth)))  
         self.TurnOnDisplay()
 
     '''
@@ -343,8 +295,7 @@ class EPD:
         self.send_command(0x10) #enter deep sleep
         self.send_data(0x01)
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_standby(2000)
 
 ### END OF FILE ###
 
@@ -30,8 +30,8 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 from PIL import Image
-import RPi.GPIO as GPIO
 
 # Display resolution
 EPD_WIDTH       = 104
@@ -180,9 +180,8 @@ class EPD:
     
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 0):      # 0: idle, 1: busy
-            self.send_command(0x71)
-            epdconfig.delay_ms(100)  
+        # 0: busy, 1: idle
+        epdconfig.wait_for_status(self.busy_pin, 0, lambda: self.send_command(0x71), 100)
         logger.debug("e-Paper busy release")
         
     def TurnOnDisplay(self):
@@ -262,28 +261,7 @@ class EPD:
         self.send_data2(self.lut_bb1)
 
     def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.pack_1bpp(image, self.width, self.height)
 
     def display(self, image):
         if (Image == None):
@@ -295,7 +273,7 @@ class EPD:
             linewidth = int(self.width/8) + 1
 
         self.send_command(0x10)
-        self.send_data2([0x00] * self.height * linewidth)
+        self.send_data2(epdbuffer.solid(0x00, self.height * linewidth))
         epdconfig.delay_ms(10)
         
         self.send_command(0x13)
@@ -325,10 +303,7 @@ class EPD:
         else:
             linewidth = int(self.width/8) + 1
 
-        buf = [0x00] * self.height * linewidth
-
-        for i in range(self.height * linewidth):
-            buf[i] = ~image[i]
+        buf = epdbuffer.invert(image)
         
         self.send_command(0x10)
         self.send_data2(image)
@@ -348,11 +323,11 @@ class EPD:
             linewidth = int(self.width/8) + 1
 
         self.send_command(0x10)
-        self.send_data2([0x00] * self.height * linewidth)
+        self.send_data2(epdbuffer.solid(0x00, self.height * linewidth))
         epdconfig.delay_ms(10)
         
         self.send_command(0x13)
-        self.send_data2([0xFF] * self.height * linewidth)
+        self.send_data2(epdbuffer.solid(0xFF, self.height * linewidth))
         epdconfig.delay_ms(10)
         
         self.SetFullReg()
@@ -365,8 +340,7 @@ class EPD:
         self.send_command(0X07) # deep sleep  
         self.send_data(0xA5)
 
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_standby(2000)
 
 ### END OF FILE ###
 
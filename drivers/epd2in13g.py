@@ -30,15 +30,18 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 import PIL
-from PIL import Image
 import io
 
 # Display resolution
 EPD_WIDTH       = 122
 EPD_HEIGHT      = 250
 
+# Colors supported by the panel, in RAM index order
+EPD_PALETTE     = (0,0,0,  255,255,255,  255,255,0,   255,0,0)
+
 logger = logging.getLogger(__name__)
 
 class EPD:
@@ -80,12 +83,18 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a lot of data
+    def send_data2(self, data):
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
         
     def ReadBusy(self):
         logger.debug("e-Paper busy H")
         epdconfig.delay_ms(100)
-        while(epdconfig.digital_read(self.busy_pin) == 0):      # 0: idle, 1: busy
-            epdconfig.delay_ms(5)
+        epdconfig.wait_for_idle(self.busy_pin, 0)
         logger.debug("e-Paper busy release")
         
     def SetWindow(self):
@@ -165,40 +174,9 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        # Create a pallette with the 4 colors supported by the panel
-        pal_image = Image.new("P", (1,1))
-        pal_image.putpalette( (0,0,0,  255,255,255,  255,255,0,   255,0,0) + (0,0,0)*252)
-
-        # Check if we need to rotate the image
-        imwidth, imheight = image.size
-        if(imwidth == self.width and imheight == self.height):
-            image_temp = image
-        elif(imwidth == self.height and imheight == self.width):
-            image_temp = image.rotate(90, expand=True)
-        else:
-            logger.warning("Invalid image dimensions: %d x %d, expected %d x %d" % (imwidth, imheight, self.width, self.height))
-
-        # Convert the soruce image to the 4 colors, dithering if needed
-        image_4color = image_temp.convert("RGB").quantize(palette=pal_image)
-        buf_4color = bytearray(image_4color.tobytes('raw'))
-
-        # into a single byte to transfer to the panel
-        if self.width % 4 == 0 :
-            Width = self.width // 4
-        else :
-            Width = self.width // 4 + 1
-        Height = self.height 
-        buf = [0x00] * int(Width * Height)
-        idx = 0
-        for j in range(0, Height):
-            for i in range(0, Width):
-                if i == Width -1:
-                    buf[i + j * Width] = (buf_4color[idx] << 6) + (buf_4color[idx+1] << 4)
-                    idx = idx + 2
-                else:
-                    buf[i + j * Width] = (buf_4color[idx] << 6) + (buf_4color[idx+1] << 4) + (buf_4color[idx+2] << 2) + buf_4color[idx+3]
-                    idx = idx + 4
-        return buf
+        # Convert the source image to the 4 colors, dithering if needed,
+        # and pack 4 pixels into each byte to transfer to the panel
+        return epdbuffer.pack_palette(image, self.width, self.height, EPD_PALETTE, 2, fill=0x55)
 
     def display(self, image):
         if self.width % 4 == 0 :
@@ -207,13 +185,14 @@ class EPD:
             Width = self.width // 4 + 1
         Height = self.height
 
+        # RAM rows are Source_BITS wide: the first 31 bytes of every image
+        # row, then zero padding
+        linewidth = self.Source_BITS//4
+        keep = min(linewidth, 31)
+        pad = bytes(linewidth - keep)
+        data = bytes(image)
         self.send_command(0x10)
-        for j in range(0, Height):
-            for i in range(0, self.Source_BITS//4):
-                if i < 31 :
-                    self.send_data(image[i + j * Width])
-                else :
-                    self.send_data(0x00)
+        self.send_data2(b''.join(data[j * Width:j * Width + keep] + pad for j in range(Height)))
                     
         self.TurnOnDisplay()
         
@@ -223,9 +202,7 @@ class EPD:
 
 
         self.send_command(0x10)
-        for j in range(0, Height):
-            for i in range(0, Width):
-                    self.send_data(color)
+        self.send_data2(epdbuffer.solid(color, Width * Height))
         self.TurnOnDisplay()
 
     def sleep(self):
@@ -236,7 +213,6 @@ class EPD:
         self.send_command(0x07) # DEEP_SLEEP
         self.send_data(0XA5)
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_standby(2000)
 ### END OF FILE ###
 
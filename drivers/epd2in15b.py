@@ -29,6 +29,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 160
@@ -78,8 +79,7 @@ class EPD:
     # judge e-Paper whether is busy
     def busy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) != 0): 
-            epdconfig.delay_ms(10)
+        epdconfig.wait_for_idle(self.busy_pin, 1)
         epdconfig.delay_ms(10)
         logger.debug("e-Paper busy release")
 
@@ -138,20 +138,7 @@ class EPD:
 
     # image converted to bytearray
     def getbuffer(self, image):
-        img = image
-        imwidth, imheight = img.size
-        if(imwidth == self.width and imheight == self.height):
-            img = img.convert('1')
-        elif(imwidth == self.height and imheight == self.width):
-            # image has correct dimensions, but needs to be rotated
-            img = img.rotate(90, expand=True).convert('1')
-        else:
-            logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
-            # return a blank buffer
-            return [0x00] * (int(self.width/8) * self.height)
-
-        buf = bytearray(img.tobytes('raw'))
-        return buf
+        return epdbuffer.pack_1bpp(image, self.width, self.height, fill=0x00, rotate_first=True)
 
     # display image
     def display(self, imageblack, imagered):
@@ -163,11 +150,8 @@ class EPD:
         self.send_command(0x24)
         self.send_data2(imageblack)
         
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                imagered[i+j*linewidth] = (~imagered[i+j*linewidth])&0xFF
         self.send_command(0x26)
-        self.send_data2(imagered)
+        self.send_data2(epdbuffer.invert(imagered))
         
         self.ondisplay()
         
@@ -178,12 +162,12 @@ class EPD:
         else:
             linewidth = int(self.width/8) + 1
             
-        buf = [0xff] * (int(linewidth * self.height))
+        buf = epdbuffer.solid(0xff, int(linewidth * self.height))
             
         self.send_command(0x24)
         self.send_data2(buf)
         
-        buf = [0x00] * (int(linewidth * self.height))
+        buf = epdbuffer.solid(0x00, int(linewidth * self.height))
         self.send_command(0x26)
         self.send_data2(buf)
         
@@ -198,7 +182,6 @@ class EPD:
         self.send_command(0x10) # DEEP_SLEEP
         self.send_data(0x01) # check code
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_standby(2000)
 ### END OF FILE ###
 
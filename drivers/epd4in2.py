@@ -30,8 +30,9 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdcommand
 from PIL import Image
-import RPi.GPIO as GPIO
 
 # Display resolution
 EPD_WIDTH  = 400
@@ -42,6 +43,35 @@ GRAY2 = 0xC0
 GRAY3 = 0x80  # gray
 GRAY4 = 0x00  # Blackest
 
+BUSY = epdcommand.BUSY
+
+
+def setup_sequence(power, panel, interval):
+    """Controller setup after the hardware reset.
+
+    ``power`` is the 0x01 POWER SETTING payload, ``panel`` the 0x00 panel
+    setting and ``interval`` the 0x50 VCOM and data interval setting.
+    """
+    return epdcommand.compile_sequence([
+        (0x01, power),                          # POWER SETTING
+        (0x06, [0x17, 0x17, 0x17]),             # boost soft start
+        (0x04, []),                             # POWER_ON
+        BUSY,
+        (0x00, [panel]),                        # panel setting
+        (0x30, [0x3c]),                         # PLL setting: 3A 100HZ 29 150Hz 39 200HZ 31 171HZ
+        (0x61, [EPD_WIDTH >> 8, EPD_WIDTH & 0xFF, EPD_HEIGHT >> 8, EPD_HEIGHT & 0xFF]),  # resolution setting
+        (0x82, [0x12]),                         # vcom_DC setting
+        (0X50, [interval]),                     # VCOM AND DATA INTERVAL SETTING
+    ])
+
+
+# VDS_EN, VDG_EN; VCOM_HV, VGHL_LV; VDH; VDL. KW-BF KWR-AF BWROTP 0f.
+# 0x97 white border, 0x07 for partial refresh
+INIT_SEQUENCE = setup_sequence([0x03, 0x00, 0x2b, 0x2b], 0xbf, 0x97)
+INIT_PARTIAL_SEQUENCE = setup_sequence([0x03, 0x00, 0x2b, 0x2b], 0xbf, 0x07)
+# VGH=20V,VGL=-20V; VDH=15V; VDL=-15V. KW-3f KWR-2F BWROTP 0f BWOTP 1f
+INIT_4GRAY_SEQUENCE = setup_sequence([0x03, 0x00, 0x2b, 0x2b, 0x13], 0x3f, 0x97)
+
 logger = logging.getLogger(__name__)
 
 
@@ -57,7 +87,9 @@ class EPD:
         self.GRAY2 = GRAY2
         self.GRAY3 = GRAY3  # gray
         self.GRAY4 = GRAY4  # Blackest
-        self.DATA = [0x00] * 15000
+        # Last frame sent, in the inverted polarity the partial refresh
+        # RAM uses (0x00 is white)
+        self.DATA = bytearray(epdbuffer.bufsize(EPD_WIDTH, EPD_HEIGHT))
 
     lut_vcom0 = [
         0x00, 0x08, 0x08, 0x00, 0x00, 0x02,
@@ -214,6 +246,30 @@ class EPD:
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
     ]
 
+    # LUT registers 0x20-0x25 as sent by set_lut, Partial_SetLut and Gray_SetLut
+    LUT_SEQUENCE = epdcommand.compile_sequence([
+        (0x20, lut_vcom0),                      # vcom
+        (0x21, lut_ww),                         # ww --
+        (0x22, lut_bw),                         # bw r
+        (0x23, lut_bb),                         # wb w
+        (0x24, lut_wb),                         # bb b
+    ])
+    PARTIAL_LUT_SEQUENCE = epdcommand.compile_sequence([
+        (0x20, EPD_4IN2_Partial_lut_vcom1),
+        (0x21, EPD_4IN2_Partial_lut_ww1),
+        (0x22, EPD_4IN2_Partial_lut_bw1),
+        (0x23, EPD_4IN2_Partial_lut_wb1),
+        (0x24, EPD_4IN2_Partial_lut_bb1),
+    ])
+    GRAY_LUT_SEQUENCE = epdcommand.compile_sequence([
+        (0x20, EPD_4IN2_4Gray_lut_vcom),        # vcom
+        (0x21, EPD_4IN2_4Gray_lut_ww),          # red not use
+        (0x22, EPD_4IN2_4Gray_lut_bw),          # bw r
+        (0x23, EPD_4IN2_4Gray_lut_wb),          # wb w
+        (0x24, EPD_4IN2_4Gray_lut_bb),          # bb b
+        (0x25, EPD_4IN2_4Gray_lut_ww),          # vcom
+    ])
+
     # Hardware reset
     def reset(self):
         epdconfig.digital_write(self.reset_pin, 1)
@@ -251,101 +307,24 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 1)
 
     def ReadBusy(self):
-        self.send_command(0x71)
-        while epdconfig.digital_read(self.busy_pin) == 0:  # 0: idle, 1: busy
-            self.send_command(0x71)
-            epdconfig.delay_ms(100)
+        # 0: busy, 1: idle
+        epdconfig.wait_for_status(self.busy_pin, 0, lambda: self.send_command(0x71), 100)
 
     def set_lut(self):
-        self.send_command(0x20)  # vcom
-        self.send_data2(self.lut_vcom0)
-
-        self.send_command(0x21)  # ww --
-        self.send_data2(self.lut_ww)
-
-        self.send_command(0x22)  # bw r
-        self.send_data2(self.lut_bw)
-
-        self.send_command(0x23)  # wb w
-        self.send_data2(self.lut_bb)
-
-        self.send_command(0x24)  # bb b
-        self.send_data2(self.lut_wb)
+        epdcommand.send_sequence(self, self.LUT_SEQUENCE)
 
     def Partial_SetLut(self):
-        self.send_command(0x20)
-        self.send_data2(self.EPD_4IN2_Partial_lut_vcom1)
-
-        self.send_command(0x21)
-        self.send_data2(self.EPD_4IN2_Partial_lut_ww1)
-
-        self.send_command(0x22)
-        self.send_data2(self.EPD_4IN2_Partial_lut_bw1)
-
-        self.send_command(0x23)
-        self.send_data2(self.EPD_4IN2_Partial_lut_wb1)
-
-        self.send_command(0x24)
-        self.send_data2(self.EPD_4IN2_Partial_lut_bb1)
+        epdcommand.send_sequence(self, self.PARTIAL_LUT_SEQUENCE)
 
     def Gray_SetLut(self):
-        self.send_command(0x20)  # vcom
-        self.send_data2(self.EPD_4IN2_4Gray_lut_vcom)
-
-        self.send_command(0x21)  # red not use
-        self.send_data2(self.EPD_4IN2_4Gray_lut_ww)
-
-        self.send_command(0x22)  # bw r
-        self.send_data2(self.EPD_4IN2_4Gray_lut_bw)
-
-        self.send_command(0x23)  # wb w
-        self.send_data2(self.EPD_4IN2_4Gray_lut_wb)
-
-        self.send_command(0x24)  # bb b
-        self.send_data2(self.EPD_4IN2_4Gray_lut_bb)
-
-        self.send_command(0x25)  # vcom
-        self.send_data2(self.EPD_4IN2_4Gray_lut_ww)
+        epdcommand.send_sequence(self, self.GRAY_LUT_SEQUENCE)
 
     def init(self):
         if epdconfig.module_init() != 0:
             return -1
         # EPD hardware init start
         self.reset()
-
-        self.send_command(0x01)  # POWER SETTING
-        self.send_data(0x03)  # VDS_EN, VDG_EN
-        self.send_data(0x00)  # VCOM_HV, VGHL_LV[1], VGHL_LV[0]
-        self.send_data(0x2b)  # VDH
-        self.send_data(0x2b)  # VDL
-
-        self.send_command(0x06)  # boost soft start
-        self.send_data(0x17)
-        self.send_data(0x17)
-        self.send_data(0x17)
-
-        self.send_command(0x04)  # POWER_ON
-        self.ReadBusy()
-
-        self.send_command(0x00)  # panel setting
-        self.send_data(0xbf)  # KW-BF   KWR-AF  BWROTP 0f
-
-        self.send_command(0x30)  # PLL setting
-        self.send_data(0x3c)  # 3A 100HZ   29 150Hz 39 200HZ  31 171HZ
-
-        self.send_command(0x61)  # resolution setting
-        self.send_data(0x01)
-        self.send_data(0x90)  # 128
-        self.send_data(0x01)
-        self.send_data(0x2c)
-
-        self.send_command(0x82)  # vcom_DC setting
-        self.send_data(0x12)
-
-        self.send_command(0X50)  # VCOM AND DATA INTERVAL SETTING
-        self.send_data(
-            0x97)  # 97white border 77black border  VBDF 17|D7 VBDW 97 VBDB 57  VBDF F7 VBDW 77 VBDB 37  VBDR B7
-
+        epdcommand.send_sequence(self, INIT_SEQUENCE)
         self.set_lut()
         # EPD hardware init end
         return 0
@@ -355,40 +334,7 @@ class EPD:
             return -1
         # EPD hardware init start
         self.reset()
-
-        self.send_command(0x01)  # POWER SETTING
-        self.send_data(0x03)  # VDS_EN, VDG_EN
-        self.send_data(0x00)  # VCOM_HV, VGHL_LV[1], VGHL_LV[0]
-        self.send_data(0x2b)  # VDH
-        self.send_data(0x2b)  # VDL
-
-        self.send_command(0x06)  # boost soft start
-        self.send_data(0x17)
-        self.send_data(0x17)
-        self.send_data(0x17)
-
-        self.send_command(0x04)  # POWER_ON
-        self.ReadBusy()
-
-        self.send_command(0x00)  # panel setting
-        self.send_data(0xbf)  # KW-BF   KWR-AF  BWROTP 0f
-
-        self.send_command(0x30)  # PLL setting
-        self.send_data(0x3c)  # 3A 100HZ   29 150Hz 39 200HZ  31 171HZ
-
-        self.send_command(0x61)  # resolution setting
-        self.send_data(0x01)
-        self.send_data(0x90)  # 128
-        self.send_data(0x01)
-        self.send_data(0x2c)
-
-        self.send_command(0x82)  # vcom_DC setting
-        self.send_data(0x12)
-
-        self.send_command(0X50)  # VCOM AND DATA INTERVAL SETTING
-        self.send_data(
-            0x07)  # 97white border 77black border  VBDF 17|D7 VBDW 97 VBDB 57  VBDF F7 VBDW 77 VBDB 37  VBDR B7
-
+        epdcommand.send_sequence(self, INIT_PARTIAL_SEQUENCE)
         self.Partial_SetLut()
         # EPD hardware init end
         return 0
@@ -398,104 +344,13 @@ class EPD:
             return -1
         # EPD hardware init start
         self.reset()
-
-        self.send_command(0x01)  # POWER SETTING
-        self.send_data(0x03)
-        self.send_data(0x00)  # VGH=20V,VGL=-20V
-        self.send_data(0x2b)  # VDH=15V
-        self.send_data(0x2b)  # VDL=-15V
-        self.send_data(0x13)
-
-        self.send_command(0x06)  # booster soft start
-        self.send_data(0x17)  # A
-        self.send_data(0x17)  # B
-        self.send_data(0x17)  # C
-
-        self.send_command(0x04)
-        self.ReadBusy()
-
-        self.send_command(0x00)  # panel setting
-        self.send_data(0x3f)  # KW-3f   KWR-2F BWROTP 0f BWOTP 1f
-
-        self.send_command(0x30)  # PLL setting
-        self.send_data(0x3c)  # 100hz
-
-        self.send_command(0x61)  # resolution setting
-        self.send_data(0x01)  # 400
-        self.send_data(0x90)
-        self.send_data(0x01)  # 300
-        self.send_data(0x2c)
-
-        self.send_command(0x82)  # vcom_DC setting
-        self.send_data(0x12)
-
-        self.send_command(0X50)  # VCOM AND DATA INTERVAL SETTING
-        self.send_data(0x97)
+        epdcommand.send_sequence(self, INIT_4GRAY_SEQUENCE)
 
     def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if imwidth == self.width and imheight == self.height:
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif imwidth == self.height and imheight == self.width:
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy * self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.pack_1bpp(image, self.width, self.height)
 
     def getbuffer_4Gray(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 4) * self.height)
-        image_monocolor = image.convert('L')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        i = 0
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if imwidth == self.width and imheight == self.height:
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0xC0:
-                        pixels[x, y] = 0x80
-                    elif pixels[x, y] == 0x80:
-                        pixels[x, y] = 0x40
-                    i = i + 1
-                    if i % 4 == 0:
-                        buf[int((x + (y * self.width)) / 4)] = (
-                                    (pixels[x - 3, y] & 0xc0) | (pixels[x - 2, y] & 0xc0) >> 2 | (
-                                        pixels[x - 1, y] & 0xc0) >> 4 | (pixels[x, y] & 0xc0) >> 6)
-
-        elif imwidth == self.height and imheight == self.width:
-            logger.debug("Horizontal")
-            for x in range(imwidth):
-                for y in range(imheight):
-                    newx = y
-                    newy = x
-                    if pixels[x, y] == 0xC0:
-                        pixels[x, y] = 0x80
-                    elif pixels[x, y] == 0x80:
-                        pixels[x, y] = 0x40
-                    i = i + 1
-                    if i % 4 == 0:
-                        buf[int((newx + (newy * self.width)) / 4)] = (
-                                    (pixels[x, y - 3] & 0xc0) | (pixels[x, y - 2] & 0xc0) >> 2 | (
-                                        pixels[x, y - 1] & 0xc0) >> 4 | (pixels[x, y] & 0xc0) >> 6)
-
-        return buf
+        return epdbuffer.pack_4gray(image, self.width, self.height, transpose=epdbuffer.TRANSPOSE)
 
     def display(self, image):
         if self.width % 8 == 0:
@@ -506,10 +361,11 @@ class EPD:
         self.send_command(0x92)
         self.set_lut()
         self.send_command(0x10)
-        self.send_data2([0xFF] * int(self.width * linewidth))
+        self.send_data2(epdbuffer.solid(0xFF, int(self.width * linewidth)))
 
         self.send_command(0x13)
         self.send_data2(image)
+        self.DATA = epdbuffer.invert(bytearray(image))
 
         self.send_command(0x12)
         self.ReadBusy()
@@ -524,44 +380,40 @@ class EPD:
             Width = int(EPD_WIDTH / 8)
         Height = EPD_HEIGHT
 
-        if X_start % 8 != 0:
-            X_start = int(X_start / 8) + 1
-        else:
-            X_start = int(X_start / 8)
-        if X_end % 8 != 0:
-            X_end = int(X_end / 8) + 1
-        else:
-            X_end = int(X_end / 8)
-
-        buf = [0x00] * (Y_end - Y_start) * (X_end - X_start)
+        # byte columns covering the pixels X_start..X_end, clipped to the panel
+        X_start = max(X_start, 0) // 8
+        X_end = min((X_end + 7) // 8, Width)
+        Y_start = max(Y_start, 0)
+        Y_end = min(Y_end, Height)
+        if X_start >= X_end or Y_start >= Y_end:
+            return
 
+        x0, x1 = X_start * 8, X_end * 8 - 1
+        y1 = Y_end - 1
         self.send_command(0x91)  # This command makes the display enter partial mode
         self.send_command(0x90)  # resolution setting
-        self.send_data(int(X_start * 8 / 256))
-        self.send_data(int(X_start * 8 % 256))  # x-start
-
-        self.send_data(int(X_end * 8 / 256))
-        self.send_data(int(X_end * 8 % 256) - 1)  # x-end
-
-        self.send_data(int(Y_start / 256))
-        self.send_data(int(Y_start % 256))  # y-start
-
-        self.send_data(int(Y_end / 256))
-        self.send_data(int(Y_end % 256) - 1)  # y-end
-        self.send_data(0x28)
+        self.send_data2(bytes((
+            x0 >> 8, x0 & 0xFF,             # x-start
+            x1 >> 8, x1 & 0xFF,             # x-end
+            Y_start >> 8, Y_start & 0xFF,   # y-start
+            y1 >> 8, y1 & 0xFF,             # y-end
+            0x28,
+        )))
+
+        window = X_end - X_start
+        old = epdbuffer.crop(self.DATA, Width, X_start, Y_start, X_end, Y_end)
+        new = epdbuffer.invert(epdbuffer.crop(Image, Width, X_start, Y_start, X_end, Y_end))
 
         self.send_command(0x10)  # writes Old data to SRAM for programming
-        for j in range(0, Y_end - Y_start):
-            for i in range(0, X_end - X_start):
-                buf[j * (X_end - X_start) + i] = self.DATA[(Y_start + j) * Width + X_start + i]
-        self.send_data2(buf)
+        self.send_data2(old)
 
         self.send_command(0x13)  # writes New data to SRAM.
-        for j in range(0, Y_end - Y_start):
-            for i in range(0, X_end - X_start):
-                buf[j * (X_end - X_start) + i] = ~Image[(Y_start + j) * Width + X_start + i]
-                self.DATA[(Y_start + j) * Width + X_start + i] = ~Image[(Y_start + j) * Width + X_start / 8 + i]
-        self.send_data2(buf)
+        self.send_data2(new)
+
+        # the new window is the old data of the next partial refresh
+        for j in range(Y_end - Y_start):
+            row = (Y_start + j) * Width
+            self.DATA[row + X_start:row + X_end] = new[j * window:(j + 1) * window]
 
         self.send_command(0x12)  # DISPLAY REFRESH
         epdconfig.delay_ms(200)  # The delay here is necessary, 200uS at least!!!
@@ -570,86 +422,18 @@ class EPD:
     def display_4Gray(self, image):
         self.send_command(0x92)
         self.set_lut()
+        # RAM bits for black, gray2, gray1 and white
+        plane1, plane2 = epdbuffer.split_4gray(image, self.width, self.height, (0, 0, 1, 1), (0, 1, 0, 1))
         self.send_command(0x10)
-
-        if self.width % 8 == 0:
-            linewidth = int(self.width / 8)
-        else:
-            linewidth = int(self.width / 8) + 1
-
-        buf = [0x00] * self.height * linewidth
-
-        for i in range(0, int(EPD_WIDTH * EPD_HEIGHT / 8)):  # EPD_WIDTH * EPD_HEIGHT / 4
-            temp3 = 0
-            for j in range(0, 2):
-                temp1 = image[i * 2 + j]
-                for k in range(0, 2):
-                    temp2 = temp1 & 0xC0
-                    if temp2 == 0xC0:
-                        temp3 |= 0x01  # white
-                    elif temp2 == 0x00:
-                        temp3 |= 0x00  # black
-                    elif temp2 == 0x80:
-                        temp3 |= 0x01  # gray1
-                    else:  # 0x40
-                        temp3 |= 0x00  # gray2
-                    temp3 <<= 1
-
-                    temp1 <<= 2
-                    temp2 = temp1 & 0xC0
-                    if temp2 == 0xC0:  # white
-                        temp3 |= 0x01
-                    elif temp2 == 0x00:  # black
-                        temp3 |= 0x00
-                    elif temp2 == 0x80:
-                        temp3 |= 0x01  # gray1
-                    else:  # 0x40
-                        temp3 |= 0x00  # gray2
-                    if j != 1 or k != 1:
-                        temp3 <<= 1
-                    temp1 <<= 2
-            buf[i] = temp3
-        self.send_data2(buf)
+        self.send_data2(plane1)
 
         self.send_command(0x13)
-
-        for i in range(0, int(EPD_WIDTH * EPD_HEIGHT / 8)):  # 5808*4  46464
-            temp3 = 0
-            for j in range(0, 2):
-                temp1 = image[i * 2 + j]
-                for k in range(0, 2):
-                    temp2 = temp1 & 0xC0
-                    if temp2 == 0xC0:
-                        temp3 |= 0x01  # white
-                    elif temp2 == 0x00:
-                        temp3 |= 0x00  # black
-                    elif temp2 == 0x80:
-                        temp3 |= 0x00  # gray1
-                    else:  # 0x40
-                        temp3 |= 0x01  # gray2
-                    temp3 <<= 1
-
-                    temp1 <<= 2
-                    temp2 = temp1 & 0xC0
-                    if temp2 == 0xC0:  # white
-                        temp3 |= 0x01
-                    elif temp2 == 0x00:  # black
-                        temp3 |= 0x00
-                    elif temp2 == 0x80:
-                        temp3 |= 0x00  # gray1
-                    else:  # 0x40
-                        temp3 |= 0x01  # gray2
-                    if j != 1 or k != 1:
-                        temp3 <<= 1
-                    temp1 <<= 2
-            buf[i] = temp3
-        self.send_data2(buf)
+        self.send_data2(plane2)
 
         self.Gray_SetLut()
         self.send_command(0x12)
         epdconfig.delay_ms(200)
         self.ReadBusy()
-        # pass
 
     def Clear(self):
         if self.width % 8 == 0:
@@ -658,10 +442,11 @@ class EPD:
             linewidth = int(self.width / 8) + 1
 
         self.send_command(0x10)
-        self.send_data2([0xff] * int(self.height * linewidth))
+        self.send_data2(epdbuffer.solid(0xff, int(self.height * linewidth)))
 
         self.send_command(0x13)
-        self.send_data2([0xff] * int(self.height * linewidth))
+        self.send_data2(epdbuffer.solid(0xff, int(self.height * linewidth)))
+        self.DATA = bytearray(int(self.height * linewidth))
 
         self.send_command(0x12)
         self.ReadBusy()
@@ -672,7 +457,6 @@ class EPD:
         self.send_command(0x07)  # DEEP_SLEEP
         self.send_data(0XA5)
 
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_standby(2000)
 
 ### END OF FILE ###
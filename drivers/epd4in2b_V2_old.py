@@ -29,6 +29,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 400
@@ -81,12 +82,10 @@ class EPD:
     def ReadBusy(self):
         logger.debug("e-Paper busy")
         if(self.flag == 1):
-            while(epdconfig.digital_read(self.busy_pin) == 1): 
-                epdconfig.delay_ms(100) 
+            epdconfig.wait_for_idle(self.busy_pin, 1)
         
         else:
-            while(epdconfig.digital_read(self.busy_pin) == 0): 
-                epdconfig.delay_ms(100) 
+            epdconfig.wait_for_idle(self.busy_pin, 0)
         logger.debug("e-Paper busy release")
 
     def TurnOnDisplay(self):
@@ -155,88 +154,41 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.pack_1bpp(image, self.width, self.height)
 
     def display(self, imageblack, imagered):
-        high = self.height
-        if( self.width % 8 == 0) :
-            wide =  self.width // 8
-        else :
-            wide =  self.width // 8 + 1
-        
+        size = epdbuffer.bufsize(self.width, self.height)
         if(self.flag == 1):
             self.send_command(0x24)
-            for j in range(0, high):
-                for i in range(0, wide):
-                    self.send_data(imageblack[i + j * wide]) 
+            self.send_data2(imageblack[:size])
                     
             self.send_command(0x26)
-            for j in range(0, high):
-                for i in range(0, wide):
-                    self.send_data(~imagered[i + j * wide]) 
+            self.send_data2(epdbuffer.invert(imagered[:size]))
         
         else:
             self.send_command(0x10)
-            for j in range(0, high):
-                for i in range(0, wide):
-                    self.send_data(imageblack[i + j * wide]) 
+            self.send_data2(imageblack[:size])
                     
             self.send_command(0x13)
-            for j in range(0, high):
-                for i in range(0, wide):
-                    self.send_data(imagered[i + j * wide]) 
+            self.send_data2(imagered[:size])
 
         self.TurnOnDisplay()
         
     def Clear(self):
-        high = self.height
-        if( self.width % 8 == 0) :
-            wide =  self.width // 8
-        else :
-            wide =  self.width // 8 + 1
-
+        size = epdbuffer.bufsize(self.width, self.height)
         if(self.flag == 1):
             self.send_command(0x24)
-            for j in range(0, high):
-                for i in range(0, wide):
-                    self.send_data(0xff) 
+            self.send_data2(epdbuffer.solid(0xFF, size))
                     
             self.send_command(0x26)
-            for j in range(0, high):
-                for i in range(0, wide):
-                    self.send_data(0x00) 
+            self.send_data2(epdbuffer.solid(0x00, size))
         
         else:
             self.send_command(0x10)
-            for j in range(0, high):
-                for i in range(0, wide):
-                    self.send_data(0xff) 
+            self.send_data2(epdbuffer.solid(0xFF, size))
                     
             self.send_command(0x13)
-            for j in range(0, high):
-                for i in range(0, wide):
-                    self.send_data(0xff) 
+            self.send_data2(epdbuffer.solid(0xFF, size))
 
         self.TurnOnDisplay()
 
@@ -253,7 +205,6 @@ class EPD:
             self.send_command(0X07) 
             self.send_data(0xA5)
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_standby(2000)
 ### END OF FILE ###
 
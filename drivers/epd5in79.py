@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 792
@@ -127,8 +128,7 @@ class EPD:
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      #  0: idle, 1: busy
-            epdconfig.delay_ms(200)
+        epdconfig.wait_for_idle(self.busy_pin, 1)
         logger.debug("e-Paper busy release")
 
     def TurnOnDisplay(self):
@@ -371,80 +371,24 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if imwidth == self.width and imheight == self.height:
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif imwidth == self.height and imheight == self.width:
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy * self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.pack_1bpp(image, self.width, self.height)
     
     def getbuffer_4Gray(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 4) * self.height)
-        image_monocolor = image.convert('L')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        i=0
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((x + (y * self.width))/4)] = ((pixels[x-3, y]&0xc0) | (pixels[x-2, y]&0xc0)>>2 | (pixels[x-1, y]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6)
-                        
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for x in range(imwidth):
-                for y in range(imheight):
-                    newx = y
-                    newy = self.height - x - 1
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((newx + (newy * self.width))/4)] = ((pixels[x, y-3]&0xc0) | (pixels[x, y-2]&0xc0)>>2 | (pixels[x, y-1]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6) 
-        return buf
+        return epdbuffer.pack_4gray(image, self.width, self.height)
 
     def display(self, imageblack):
         Width =int(self.width / 16)+1
         Width1 =int(self.width / 8)
         
         self.send_command(0x24)
-        for i in range(self.height):
-            self.send_data2(imageblack[i * Width1 : i * Width1+Width])
+        self.send_data2(epdbuffer.crop(imageblack, Width1, 0, 0, Width, self.height))
         self.send_command(0X26)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.solid(0x00, 13600))
 
         self.send_command(0xA4)
-        for i in range(self.height):
-            self.send_data2(imageblack[i * Width1 + Width - 1 : i * Width1 + Width * 2 - 1])
+        self.send_data2(epdbuffer.crop(imageblack, Width1, Width - 1, 0, Width * 2 - 1, self.height))
         self.send_command(0xA6)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.solid(0x00, 13600))
 
         self.TurnOnDisplay()
 
@@ -453,64 +397,58 @@ class EPD:
         Width1 =int(self.width / 8)
         
         self.send_command(0x24)
-        for i in range(self.height):
-            self.send_data2(imageblack[i * Width1 : i * Width1+Width])
+        self.send_data2(epdbuffer.crop(imageblack, Width1, 0, 0, Width, self.height))
         self.send_command(0X26)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.solid(0x00, 13600))
 
         self.send_command(0xA4)
-        for i in range(self.height):
-            self.send_data2(imageblack[i * Width1 + Width - 1 : i * Width1 + Width * 2 - 1])
+        self.send_data2(epdbuffer.crop(imageblack, Width1, Width - 1, 0, Width * 2 - 1, self.height))
         self.send_command(0xA6)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.solid(0x00, 13600))
 
         self.TurnOnDisplay()
 
         self.send_command(0x26)
-        for i in range(self.height):
-            self.send_data2(imageblack[i * Width1 : i * Width1+Width])
+        self.send_data2(epdbuffer.crop(imageblack, Width1, 0, 0, Width, self.height))
 
         self.send_command(0xA6)
-        for i in range(self.height):
-            self.send_data2(imageblack[i * Width1 + Width - 1 : i * Width1 + Width * 2 - 1])
+        self.send_data2(epdbuffer.crop(imageblack, Width1, Width - 1, 0, Width * 2 - 1, self.height))
 
     def display_Base_color(self, color):
         Width =int(self.width / 16)+1
         Width1 =int(self.width / 8)
         
         self.send_command(0x24)
-        self.send_data2([color] * 13600)
+        self.send_data2(epdbuffer.solid(color, 13600))
         self.send_command(0X26)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.solid(0x00, 13600))
 
         self.send_command(0xA4)
-        self.send_data2([color] * 13600)
+        self.send_data2(epdbuffer.solid(color, 13600))
         self.send_command(0xA6)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.solid(0x00, 13600))
 
         self.TurnOnDisplay()
 
         self.send_command(0x26)
-        self.send_data2([color] * 13600)
+        self.send_data2(epdbuffer.solid(color, 13600))
 
         self.send_command(0xA6)
-        self.send_data2([color] * 13600)
+        self.send_data2(epdbuffer.solid(color, 13600))
 
     def display_Fast(self, imageblack):
         Width =int(self.width / 16)+1
         Width1 =int(self.width / 8)
         
         self.send_command(0x24)
-        for i in range(self.height):
-            self.send_data2(imageblack[i * Width1 : i * Width1+Width])
+        self.send_data2(epdbuffer.crop(imageblack, Width1, 0, 0, Width, self.height))
         self.send_command(0X26)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.solid(0x00, 13600))
 
         self.send_command(0xA4)
-        for i in range(self.height):
-            self.send_data2(imageblack[i * Width1 + Width - 1 : i * Width1 + Width * 2 - 1])
+        self.send_data2(epdbuffer.crop(imageblack, Width1, Width - 1, 0, Width * 2 - 1, self.height))
         self.send_command(0xA6)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.solid(0x00, 13600))
 
         self.TurnOnDisplay_Fast()
     
@@ -534,8 +472,7 @@ class EPD:
         self.send_data(0x01) 	
 
         self.send_command(0x24)
-        for i in range(Height):
-            self.send_data2(Image[i * Width1 : i * Width1+Width])
+        self.send_data2(epdbuffer.crop(Image, Width1, 0, 0, Width, Height))
 
         self.send_command(0xC4)		    # Set Ram X- address Start / End position
         self.send_data(0x31)     		# XStart, POR = 00h
@@ -553,8 +490,7 @@ class EPD:
         self.send_data(0x01)
 
         self.send_command(0xA4)
-        for i in range(Height):
-            self.send_data2(Image[i * Width1 + Width - 1 : i * Width1 + Width * 2 - 1])
+        self.send_data2(epdbuffer.crop(Image, Width1, Width - 1, 0, Width * 2 - 1, Height))
 
         self.TurnOnDisplay_Partial()
 
@@ -563,102 +499,30 @@ class EPD:
         Width =int(self.width / 16)+1
         Width1 =int(self.width / 8)
 
+        # RAM bits for black, gray2, gray1 and white
+        plane1, plane2 = epdbuffer.split_4gray(image, self.width, self.height, (0, 1, 0, 1), (0, 0, 1, 1))
         self.send_command(0x24)
-        for j in range(self.height):   
-            for i in range(Width):
-                temp3=0
-                for o in range(0, 2):
-                    temp1 = image[(j * Width1 + i)*2+o]
-                    for k in range(0, 4):
-                        temp2 = temp1&0xC0 
-                        if(temp2 == 0xC0):
-                            temp3 |= 0x01
-                        elif(temp2 == 0x00):
-                            temp3 |= 0x00  
-                        elif(temp2 == 0x80): 
-                            temp3 |= 0x00 
-                        else: #0x40
-                            temp3 |= 0x01 
-                        if(o!=1 or k!=3):
-                            temp3 <<= 1
-                        temp1 <<= 2
-                self.send_data(temp3)
-            
-        self.send_command(0x26)	       
-        for j in range(self.height):   
-            for i in range(Width):
-                temp3=0
-                for o in range(0, 2):
-                    temp1 = image[(j * Width1 + i)*2+o]
-                    for k in range(0, 4):
-                        temp2 = temp1&0xC0 
-                        if(temp2 == 0xC0):
-                            temp3 |= 0x01
-                        elif(temp2 == 0x00):
-                            temp3 |= 0x00  
-                        elif(temp2 == 0x80): 
-                            temp3 |= 0x01 
-                        else: #0x40
-                            temp3 |= 0x00 
-                        if(o!=1 or k!=3):
-                            temp3 <<= 1
-                        temp1 <<= 2
-                self.send_data(temp3)
+        self.send_data2(epdbuffer.crop_rows(plane1, Width1, 0, Width))
+        self.send_command(0x26)
+        self.send_data2(epdbuffer.crop_rows(plane2, Width1, 0, Width))
 
         self.send_command(0xA4)
-        for j in range(self.height):   
-            for i in range(Width):
-                temp3=0
-                for o in range(0, 2):
-                    temp1 = image[(j * Width1 + i + Width - 1)*2+o]
-                    for k in range(0, 4):
-                        temp2 = temp1&0xC0 
-                        if(temp2 == 0xC0):
-                            temp3 |= 0x01
-                        elif(temp2 == 0x00):
-                            temp3 |= 0x00  
-                        elif(temp2 == 0x80): 
-                            temp3 |= 0x00 
-                        else: #0x40
-                            temp3 |= 0x01 
-                        if(o!=1 or k!=3):
-                            temp3 <<= 1
-                        temp1 <<= 2
-                self.send_data(temp3)
-            
-        self.send_command(0xA6)	       
-        for j in range(self.height):   
-            for i in range(Width):
-                temp3=0
-                for o in range(0, 2):
-                    temp1 = image[(j * Width1 + i + Width - 1)*2+o]
-                    for k in range(0, 4):
-                        temp2 = temp1&0xC0 
-                        if(temp2 == 0xC0):
-                            temp3 |= 0x01
-                        elif(temp2 == 0x00):
-                            temp3 |= 0x00  
-                        elif(temp2 == 0x80): 
-                            temp3 |= 0x01 
-                        else: #0x40
-                            temp3 |= 0x00 
-                        if(o!=1 or k!=3):
-                            temp3 <<= 1
-                        temp1 <<= 2
-                self.send_data(temp3)
-        
+        self.send_data2(epdbuffer.crop_rows(plane1, Width1, Width - 1, Width * 2 - 1))
+        self.send_command(0xA6)
+        self.send_data2(epdbuffer.crop_rows(plane2, Width1, Width - 1, Width * 2 - 1))
+
         self.TurnOnDisplay_4GRAY()
 
     def Clear(self):
         self.send_command(0x24)
-        self.send_data2([0xFF] * 13600)
+        self.send_data2(epdbuffer.solid(0xFF, 13600))
         self.send_command(0X26)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.solid(0x00, 13600))
 
         self.send_command(0xA4)
-        self.send_data2([0xFF] * 13600)
+        self.send_data2(epdbuffer.solid(0xFF, 13600))
         self.send_command(0xA6)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.solid(0x00, 13600))
 
         self.TurnOnDisplay()
 
@@ -666,7 +530,6 @@ class EPD:
         self.send_command(0X10) # deep sleep
         self.send_data(0x03)
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_standby(2000)
 ### END OF FILE ###
 
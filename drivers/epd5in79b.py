@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 792
@@ -76,8 +77,7 @@ class EPD:
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      #  0: idle, 1: busy
-            epdconfig.delay_ms(200)
+        epdconfig.wait_for_idle(self.busy_pin, 1)
         logger.debug("e-Paper busy release")
 
     def TurnOnDisplay(self):
@@ -135,64 +135,37 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.pack_1bpp(image, self.width, self.height)
 
     def display(self, imageblack, imagered):
-        buf = [0x00] * int(self.width * self.height / 8)
-        for i in range(0, int(self.width * self.height / 8)):
-            buf[i] = ~imagered[i]
+        buf = epdbuffer.invert(imagered)
 
         Width =int(self.width / 16)+1
         Width1 =int(self.width / 8)
         Height = self.height
         
         self.send_command(0x24)
-        for i in range(Height):
-            self.send_data2(imageblack[i * Width1 : i * Width1+Width])
+        self.send_data2(epdbuffer.crop(imageblack, Width1, 0, 0, Width, Height))
         self.send_command(0X26)
-        for i in range(self.height):
-            self.send_data2(buf[i * Width1 : i * Width1+Width])
+        self.send_data2(epdbuffer.crop(buf, Width1, 0, 0, Width, self.height))
 
         self.send_command(0xA4)
-        for i in range(self.height):
-            self.send_data2(imageblack[i * Width1 + Width - 1 : i * Width1 + Width * 2 - 1])
+        self.send_data2(epdbuffer.crop(imageblack, Width1, Width - 1, 0, Width * 2 - 1, self.height))
         self.send_command(0xA6)
-        for i in range(self.height):
-            self.send_data2(buf[i * Width1 + Width - 1 : i * Width1 + Width * 2 - 1])
+        self.send_data2(epdbuffer.crop(buf, Width1, Width - 1, 0, Width * 2 - 1, self.height))
 
         self.TurnOnDisplay()
 
     def Clear(self):
         self.send_command(0x24)
-        self.send_data2([0xFF] * 13600)
+        self.send_data2(epdbuffer.solid(0xFF, 13600))
         self.send_command(0X26)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.solid(0x00, 13600))
 
         self.send_command(0xA4)
-        self.send_data2([0xFF] * 13600)
+        self.send_data2(epdbuffer.solid(0xFF, 13600))
         self.send_command(0xA6)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.solid(0x00, 13600))
 
         self.TurnOnDisplay()
 
@@ -200,7 +173,6 @@ class EPD:
         self.send_command(0X10) # deep sleep
         self.send_data(0x03)
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_standby(2000)
 ### END OF FILE ###
 
@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 880
@@ -75,9 +76,7 @@ class EPD:
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        busy = epdconfig.digital_read(self.busy_pin)
-        while(busy == 1):
-            busy = epdconfig.digital_read(self.busy_pin)
+        epdconfig.wait_for_idle(self.busy_pin, 1)
         epdconfig.delay_ms(200)
         
     def init(self):
@@ -131,19 +130,7 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        img = image
-        imwidth, imheight = img.size
-        if(imwidth == self.width and imheight == self.height):
-            img = img.convert('1')
-        elif(imwidth == self.height and imheight == self.width):
-            img = img.rotate(90, expand=True).convert('1')
-        else:
-            logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
-            # return a blank buffer
-            return [0xff] * int(self.width * self.height / 8)
-
-        buf = bytearray(img.tobytes('raw'))
-        return buf
+        return epdbuffer.pack_1bpp(image, self.width, self.height, rotate_first=True)
         
     def display(self, image):
         self.send_command(0x4F) 
@@ -157,7 +144,7 @@ class EPD:
         self.ReadBusy()
         
     def Clear(self):
-        buf = [0xff] * int(self.width * self.height / 8)
+        buf = epdbuffer.solid(0xff, int(self.width * self.height / 8))
         self.send_command(0x4F) 
         self.send_data2([0x00, 0x00])
         self.send_command(0x24)
@@ -176,7 +163,6 @@ class EPD:
         self.send_command(0x10)
         self.send_data(0x01)
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_standby(2000)
 ### END OF FILE ###
 
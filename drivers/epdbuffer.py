@@ -0,0 +1,318 @@
+"""Frame buffer packing shared by the e-Paper drivers.
+
+The vendor drivers built their buffers with a nested per-pixel Python loop,
+which takes seconds per frame on a Pi Zero. Everything here is done with
+bulk PIL operations (``convert``/``transpose``/``tobytes``) and 256-entry
+translation tables, so the per-pixel work happens in C.
+"""
+
+import functools
+import logging
+
+from PIL import Image, ImageChops
+
+logger = logging.getLogger(__name__)
+
+# Equivalent to the drivers' ``newx = y; newy = height - x - 1`` remap.
+ROTATE_90 = Image.ROTATE_90
+TRANSPOSE = Image.TRANSPOSE
+
+# Raw PIL packers for palette indices, MSB first, rows padded to a byte.
+_RAWMODES = {1: 'P;1', 2: 'P;2', 4: 'P;4', 8: 'P'}
+
+INVERT = bytes(0xFF ^ i for i in range(256))
+
+# 4-gray levels: 0 black, 1 gray2 (0x40), 2 gray1 (0x80), 3 white. The
+# vendor loops remapped 0xC0 -> 0x80 and 0x80 -> 0x40, then kept the top
+# two bits of each pixel.
+GRAY4 = [v >> 6 for v in range(256)]
+GRAY4[0x80] = 1
+GRAY4[0xC0] = 2
+
+
+def linewidth(width, bpp=1):
+    """Bytes per panel row at ``bpp`` bits per pixel, padded to a byte."""
+    return (width * bpp + 7) // 8
+
+
+def bufsize(width, height, bpp=1):
+    return linewidth(width, bpp) * height
+
+
+def orient(image, width, height, transpose=ROTATE_90):
+    """Return ``image`` in panel orientation, or None if it fits neither.
+
+    Images that are ``height`` x ``width`` are turned with ``transpose``.
+    """
+    imwidth, imheight = image.size
+    if imwidth == width and imheight == height:
+        return image
+    if imwidth == height and imheight == width:
+        return image.transpose(transpose)
+    logger.warning("Wrong image dimensions: must be %dx%d", width, height)
+    return None
+
+
+def crop_rows(buf, stride, start, stop):
+    """Concatenate bytes ``start:stop`` of every ``stride``-byte row."""
+    if not isinstance(buf, (bytes, bytearray, memoryview)):
+        buf = bytes(buf)
+    view = memoryview(buf)
+    return bytearray(b''.join(view[row + start:row + stop] for row in range(0, len(view), stride)))
+
+
+def crop(buf, stride, x0, y0, x1, y1):
+    """Bytes ``x0:x1`` of rows ``y0:y1`` of a ``stride``-byte-wide buffer.
+
+    The box is clipped to the buffer, like the vendor loops that tested
+    every byte of the frame against it.
+    """
+    if not isinstance(buf, (bytes, bytearray, memoryview)):
+        buf = bytes(buf)
+    x0, y0 = max(x0, 0), max(y0, 0)
+    x1, y1 = min(x1, stride), min(y1, len(buf) // stride)
+    if x0 >= x1 or y0 >= y1:
+        return bytearray()
+    return crop_rows(memoryview(buf)[y0 * stride:y1 * stride], stride, x0, x1)
+
+
+@functools.lru_cache(maxsize=32)
+def solid(value, size):
+    """``size`` bytes of ``value``, shared so repeated clears allocate once.
+
+    The result is immutable; ``send_data2`` hands it to spidev as is.
+    """
+    return bytes((value & 0xFF,)) * size
+
+
+def invert(buf):
+    """Return a copy of ``buf`` with every bit flipped."""
+    if not isinstance(buf, (bytes, bytearray)):
+        buf = bytes(buf)
+    return buf.translate(INVERT)
+
+
+def dirty_rect(old, new, stride):
+    """Bounding box of the bytes that differ between two frame buffers.
+
+    Returns ``(x0, y0, x1, y1)`` with x in bytes and y in rows, end
+    exclusive, or None if the buffers are equal. A missing or differently
+    sized ``old`` buffer makes the whole frame dirty.
+    """
+    height = len(new) // stride
+    if old is None or len(old) != len(new):
+        return (0, 0, stride, height)
+    if old == new:
+        return None
+    rows = [y for y in range(height)
+            if old[y * stride:(y + 1) * stride] != new[y * stride:(y + 1) * stride]]
+    # OR the XOR of every changed row to find the changed byte columns
+    changed = 0
+    for y in rows:
+        changed |= (int.from_bytes(old[y * stride:(y + 1) * stride], 'big')
+                    ^ int.from_bytes(new[y * stride:(y + 1) * stride], 'big'))
+    x0 = stride - (changed.bit_length() + 7) // 8
+    x1 = stride - ((changed & -changed).bit_length() - 1) // 8
+    return (x0, rows[0], x1, rows[-1] + 1)
+
+
+def rect_area(rect):
+    """Size in bytes of a ``dirty_rect`` box."""
+    x0, y0, x1, y1 = rect
+    return (x1 - x0) * (y1 - y0)
+
+
+def pack_indexed(image, bpp):
+    """Pack an 'L' or 'P' image of palette indices into ``bpp`` bits each.
+
+    Pixels are packed MSB first and every row starts on a byte boundary.
+    """
+    if image.mode != 'P':
+        image = image.convert('P')
+    return bytearray(image.tobytes('raw', _RAWMODES[bpp]))
+
+
+@functools.lru_cache(maxsize=None)
+def palette_image(palette):
+    """The ``quantize()`` palette image for ``palette``, built once per panel."""
+    pal_image = Image.new('P', (1, 1))
+    pal_image.putpalette(tuple(palette) + (0, 0, 0) * (256 - len(palette) // 3))
+    return pal_image
+
+
+@functools.lru_cache(maxsize=None)
+def _palette_colors(palette):
+    return frozenset(tuple(palette[i:i + 3]) for i in range(0, len(palette), 3))
+
+
+@functools.lru_cache(maxsize=None)
+def _exact_tables(palette, default):
+    """Build the lookup tables used by ``index_exact``.
+
+    Each band value is mapped to its position among the palette's levels
+    for that band (or a spare "no match" code), so the three band codes
+    sum to a unique key below 256 for every palette colour.
+    """
+    colors = [tuple(palette[i:i + 3]) for i in range(0, len(palette), 3)]
+    levels = [sorted(set(color[band] for color in colors)) for band in range(3)]
+    radix = [len(level) + 1 for level in levels]
+    if radix[0] * radix[1] * radix[2] > 256:
+        return None
+    scale = (radix[1] * radix[2], radix[2], 1)
+    band_luts = []
+    for band in range(3):
+        codes = dict((v, i) for i, v in enumerate(levels[band]))
+        band_luts.append([codes.get(v, len(levels[band])) * scale[band] for v in range(256)])
+    table = [default] * 256
+    # walk backwards so the first of any duplicate colours wins
+    for index in range(len(colors) - 1, -1, -1):
+        key = sum(levels[band].index(colors[index][band]) * scale[band] for band in range(3))
+        table[key] = index
+    return band_luts, table
+
+
+def index_exact(image, palette, default=0):
+    """Map an RGB image to palette indices by exact colour match.
+
+    Pixels whose colour is not in ``palette`` get index ``default``.
+    """
+    tables = _exact_tables(palette, default)
+    if tables is None:
+        raise ValueError("Palette has too many distinct levels for an exact map")
+    band_luts, table = tables
+    r, g, b = image.convert('RGB').split()
+    key = ImageChops.add(ImageChops.add(r.point(band_luts[0]), g.point(band_luts[1])), b.point(band_luts[2]))
+    return key.point(table)
+
+
+def index_palette(image, palette):
+    """Map ``image`` to indices into ``palette``.
+
+    Frames already drawn in the panel's palette, or only in its exact
+    colours, are mapped through lookup tables; anything else is quantized
+    with dithering.
+    """
+    ncolors = len(palette) // 3
+    if (image.mode == 'P' and image.getpalette() is not None
+            and image.getpalette()[:len(palette)] == list(palette)
+            and image.getextrema()[1] < ncolors):
+        return image
+    image = image.convert('RGB')
+    colors = image.getcolors(ncolors)
+    if (colors is not None and _exact_tables(palette, 0) is not None
+            and all(color in _palette_colors(palette) for _, color in colors)):
+        return index_exact(image, palette)
+    return image.quantize(palette=palette_image(palette))
+
+
+def _dither(image, width, height, transpose, rotate_first):
+    """``image`` oriented for the panel and converted to '1', or None.
+
+    Dithering spreads the error along rows, so the result depends on
+    whether the image is rotated before or after the conversion.
+    """
+    if not rotate_first:
+        return orient(image.convert('1'), width, height, transpose)
+    img = orient(image, width, height, transpose)
+    return None if img is None else img.convert('1')
+
+
+def pack_1bpp(image, width, height, fill=0xFF, invert=False, transpose=ROTATE_90, rotate_first=False):
+    """Convert ``image`` to the panel's MSB-first 1bpp buffer (1 = white).
+
+    Returns a buffer of ``fill`` bytes if the image has the wrong size.
+    ``invert`` flips every bit for controllers where 1 = black.
+    ``rotate_first`` dithers after rotating rather than before.
+    """
+    img = _dither(image, width, height, transpose, rotate_first)
+    if img is None:
+        return bytearray([fill]) * bufsize(width, height)
+    if width % 8:
+        # PIL pads rows with black; the panels expect the padding white
+        padded = Image.new('1', (linewidth(width) * 8, height), 255)
+        padded.paste(img, (0, 0))
+        img = padded
+    buf = bytearray(img.tobytes('raw'))
+    if invert:
+        buf = buf.translate(INVERT)
+    return buf
+
+
+def pack_mono(image, width, height, bpp, white, fill, transpose=ROTATE_90, rotate_first=False):
+    """Pack a black/white image at ``bpp`` bits per pixel.
+
+    Black pixels become index 0 and white pixels ``white``, as used by the
+    older controllers that take 2 or 4 bits per pixel even for monochrome.
+    """
+    img = _dither(image, width, height, transpose, rotate_first)
+    if img is None:
+        return bytearray([fill]) * bufsize(width, height, bpp)
+    return pack_indexed(img.point(lambda v: white if v else 0, 'L'), bpp)
+
+
+def pack_4gray(image, width, height, fill=0xFF, transpose=ROTATE_90):
+    """Quantize ``image`` to the four gray levels and pack them at 2bpp."""
+    img = orient(image.convert('L'), width, height, transpose)
+    if img is None:
+        return bytearray([fill]) * bufsize(width, height, 2)
+    return pack_indexed(img.point(GRAY4), 2)
+
+
+def split_4gray(buf, width, height, *planes):
+    """Split a ``pack_4gray`` buffer into the 1bpp planes the RAM expects.
+
+    Each entry of ``planes`` gives the bit to send for gray levels 0-3
+    (black, gray2, gray1, white); one buffer is returned per entry.
+    """
+    img = Image.frombytes('P', (width, height), bytes(buf), 'raw', 'P;2')
+    return [bytearray(img.point([0xFF if bit else 0 for bit in bits] + [0] * 252, '1').tobytes('raw'))
+            for bits in planes]
+
+
+def _levels(levels):
+    return list(levels) + [0] * (256 - len(levels))
+
+
+def repack_2bpp(buf, width, height, levels):
+    """Re-pack a 2bpp buffer at 4bpp, as the older 4bpp controllers take it.
+
+    Pixel value ``v`` becomes ``levels[v]``.
+    """
+    img = Image.frombytes('P', (width, height), bytes(buf[:bufsize(width, height, 2)]), 'raw', 'P;2')
+    return pack_indexed(img.point(_levels(levels), 'L'), 4)
+
+
+def repack_1bpp(buf, width, height, bpp=2):
+    """Re-pack a 1bpp buffer at ``bpp``, repeating every bit ``bpp`` times."""
+    img = Image.frombytes('1', (width, height), bytes(buf[:bufsize(width, height)]))
+    return pack_indexed(img.convert('L').point(lambda v: v and (1 << bpp) - 1), bpp)
+
+
+def merge_planes(black, red, width, height, levels):
+    """Merge a black and a red 1bpp plane into one 4bpp buffer.
+
+    Each pixel becomes ``levels[black_bit | red_bit << 1]``.
+    """
+    size = bufsize(width, height)
+    black = Image.frombytes('1', (width, height), bytes(black[:size])).convert('L').point(lambda v: v and 1)
+    red = Image.frombytes('1', (width, height), bytes(red[:size])).convert('L').point(lambda v: v and 2)
+    return pack_indexed(ImageChops.add(black, red).point(_levels(levels)), 4)
+
+
+def pack_palette(image, width, height, palette, bpp, fill, transpose=ROTATE_90):
+    """Quantize ``image`` to ``palette``, dithering if needed, and pack it.
+
+    ``palette`` is a flat RGB tuple in the panel's index order.
+    """
+    img = orient(image, width, height, transpose)
+    if img is None:
+        return bytearray([fill]) * bufsize(width, height, bpp)
+    return pack_indexed(index_palette(img, palette), bpp)
+
+
+def pack_exact(image, width, height, palette, bpp, fill, default=0, transpose=ROTATE_90):
+    """Pack ``image`` by exact colour match against ``palette``, no dithering."""
+    img = orient(image, width, height, transpose)
+    if img is None:
+        return bytearray([fill]) * bufsize(width, height, bpp)
+    return pack_indexed(index_exact(img, palette, default), bpp)
@@ -0,0 +1,56 @@
+"""Controller command sequences for the e-Paper drivers.
+
+A sequence is a list of ``(command, data)`` pairs, ``data`` being the
+bytes payload (empty for bare commands), with ``BUSY`` markers wherever
+the controller has to be waited on. Drivers keep their init and update
+tables as module-level sequences and send them with ``send_sequence``:
+one SPI write per command and one per payload, instead of a DC toggle
+and a write syscall for every byte.
+"""
+
+# Marker for "wait until the controller is idle" inside a sequence
+BUSY = 'BUSY'
+
+
+def compile_sequence(sequence):
+    """Encode every payload of ``sequence`` as bytes, once at import.
+
+    Payloads may be lists of ints, as the vendor LUT tables are written.
+    """
+    return [step if step is BUSY else (step[0], bytes(step[1])) for step in sequence]
+
+
+def send_sequence(epd, sequence, busy=None):
+    """Send ``sequence`` to driver instance ``epd``.
+
+    ``BUSY`` markers call ``busy``, by default ``epd.ReadBusy``.
+    """
+    if busy is None:
+        busy = epd.ReadBusy
+    # looked up on the class, so epdstats' per-instance timing of RAM
+    # writes counts frame planes and not these parameter payloads
+    send_data2 = type(epd).send_data2
+    for step in sequence:
+        if step is BUSY:
+            busy()
+            continue
+        command, data = step
+        epd.send_command(command)
+        if data:
+            send_data2(epd, data)
+
+
+def ssd_window(x_start, y_start, x_end, y_end):
+    """SSD16xx RAM window (0x44/0x45); x is in pixels, sent as bytes."""
+    return [
+        (0x44, bytes(((x_start >> 3) & 0xFF, (x_end >> 3) & 0xFF))),
+        (0x45, bytes((y_start & 0xFF, (y_start >> 8) & 0xFF, y_end & 0xFF, (y_end >> 8) & 0xFF))),
+    ]
+
+
+def ssd_cursor(x, y):
+    """SSD16xx RAM address counters (0x4E/0x4F)."""
+    return [
+        (0x4E, bytes((x & 0xFF,))),
+        (0x4F, bytes((y & 0xFF, (y >> 8) & 0xFF))),
+    ]
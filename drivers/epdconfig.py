@@ -28,17 +28,200 @@
 #
 
 import os
+import inspect
 import logging
+import platform
 import sys
 import time
-import subprocess
+import threading
 
 from ctypes import *
 
 logger = logging.getLogger(__name__)
 
+# Width of this interpreter, which decides the DEV_Config build to load.
+# No executable is given, so platform does not shell out to file(1).
+DEV_CONFIG_SO = 'DEV_Config_%s.so' % platform.architecture(executable='')[0][:2]
 
-class RaspberryPi:
+
+def _find_library(name):
+    """Path of a shared object bundled next to this file or installed."""
+    for find_dir in (os.path.dirname(os.path.realpath(__file__)), '/usr/local/lib', '/usr/lib'):
+        path = os.path.join(find_dir, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _poll_idle(read, pin, busy, timeout, interval=0.001):
+    """Poll ``pin`` until it leaves level ``busy``; False on timeout."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while read(pin) == busy:
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+        time.sleep(interval)
+    return True
+
+
+def _spidev_bufsiz(default=4096):
+    """The spidev kernel module's per-transfer limit in bytes."""
+    try:
+        with open('/sys/module/spidev/parameters/bufsiz') as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return default
+
+
+def _write_chunks(write, data, size):
+    """Hand ``data`` to ``write`` in slices of at most ``size`` bytes."""
+    view = memoryview(data)
+    for start in range(0, len(view), size):
+        write(view[start:start + size])
+
+
+class _BackgroundWriter:
+    """Runs SPI writes on a worker thread, one in flight and one queued.
+
+    ``flush()`` waits for both and re-raises the first write error.
+    """
+
+    def __init__(self):
+        self.pending = []
+        self.error = None
+        self.cond = threading.Condition()
+        thread = threading.Thread(target=self._run, name='epd-spi-writer', daemon=True)
+        thread.start()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+                write, data, size = self.pending[0]
+            try:
+                _write_chunks(write, data, size)
+            except Exception as e:
+                self.error = self.error or e
+            with self.cond:
+                self.pending.pop(0)
+                self.cond.notify_all()
+
+    def submit(self, write, data, size):
+        with self.cond:
+            while len(self.pending) >= 2:
+                self.cond.wait()
+            self.pending.append((write, data, size))
+            self.cond.notify_all()
+
+    def flush(self):
+        with self.cond:
+            while self.pending:
+                self.cond.wait()
+        error, self.error = self.error, None
+        if error is not None:
+            raise error
+
+
+class Backend:
+    """Settings shared by every backend."""
+    busy_timeout = None
+    warm_standby = False
+    is_open = False
+    # SPI clock, and the fastest one set_spi_speed() accepts
+    spi_speed_hz = 4000000
+    max_spi_speed_hz = 20000000
+    double_buffered = False
+    chunk_size = 4096
+    _writer = None
+
+    def set_busy_timeout(self, seconds):
+        """Make busy waits raise TimeoutError after ``seconds`` (None: never)."""
+        type(self).busy_timeout = seconds
+
+    def set_warm_standby(self, enabled):
+        """Keep SPI and GPIO open while the panel sleeps between refreshes.
+
+        The drivers' sleep() then returns as soon as the deep sleep command
+        is sent, and the next init() skips reopening the bus. Call
+        module_exit() on shutdown to close it.
+        """
+        type(self).warm_standby = enabled
+
+    def module_standby(self, delaytime):
+        """Called by the drivers' sleep() after the deep sleep command.
+
+        Waits ``delaytime`` ms for the panel to settle and cuts its power,
+        unless in warm standby.
+        """
+        if not self.warm_standby:
+            self.delay_ms(delaytime)
+            self.module_exit()
+
+    def set_spi_speed(self, hz):
+        """Set the SPI clock in Hz, up to ``max_spi_speed_hz``.
+
+        Takes effect immediately if the bus is open, else at module_init().
+        """
+        if not 0 < hz <= self.max_spi_speed_hz:
+            raise ValueError("SPI clock must be between 1 and %d Hz, got %r" % (self.max_spi_speed_hz, hz))
+        type(self).spi_speed_hz = int(hz)
+        if self.is_open:
+            self._set_spi_clock()
+
+    def set_double_buffering(self, enabled):
+        """Send bulk writes from a background thread.
+
+        spi_writebyte2() then returns as soon as its buffer is queued, so
+        the drivers can prepare the next plane while this one is on the
+        wire. Every other bus or pin access waits for queued writes first.
+        """
+        self.flush()
+        type(self).double_buffered = enabled
+
+    def flush(self):
+        """Wait for background SPI writes to finish."""
+        if self._writer is not None:
+            self._writer.flush()
+
+    def _set_spi_clock(self):
+        pass
+
+    def _bulk_write(self, write, data):
+        """Send ``data`` through ``write`` in spidev-sized chunks."""
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data)
+        if not self.double_buffered:
+            _write_chunks(write, data, self.chunk_size)
+            return
+        if self._writer is None:
+            type(self)._writer = _BackgroundWriter()
+        # copied, as the caller may reuse its buffer as soon as we return
+        self._writer.submit(write, bytes(data), self.chunk_size)
+
+    def wait_for_status(self, pin, busy, poll, interval_ms=10, timeout=None):
+        """Block until ``pin`` leaves level ``busy``, calling ``poll()`` first.
+
+        For controllers that only update BUSY in answer to a get-status
+        command: ``poll`` sends it before every read, and reads are
+        ``interval_ms`` apart. Raises TimeoutError after ``timeout``
+        seconds, which defaults to ``busy_timeout``.
+        """
+        if timeout is None:
+            timeout = self.busy_timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        poll()
+        while self.digital_read(pin) == busy:
+            if deadline is not None and time.monotonic() >= deadline:
+                self._check_idle(False, timeout)
+            poll()
+            self.delay_ms(interval_ms)
+
+    def _check_idle(self, idle, timeout):
+        if not idle:
+            raise TimeoutError("e-Paper still busy after %.1f s" % timeout)
+
+
+class RaspberryPi(Backend):
     # Pin definition
     RST_PIN  = 17
     DC_PIN   = 25
@@ -47,22 +230,50 @@ class RaspberryPi:
     PWR_PIN  = 18
     MOSI_PIN = 10
     SCLK_PIN = 11
+    # 'spidev' drives the panel through spidev and gpiozero. 'native'
+    # hands the pins and the bus to DEV_Config.so instead, which claims
+    # them itself and clocks SPI at its own fixed rate. Drivers that call
+    # module_init(cleanup=True) always get the native path
+    spi_backend = 'spidev'
+    DEV_SPI = None
+    native = False
+    GPIO_RST_PIN = None
 
     def __init__(self):
         import spidev
-        import gpiozero
         
         self.SPI = spidev.SpiDev()
+        self.chunk_size = _spidev_bufsiz()
+
+    def _open_gpio(self):
+        # gpiozero claims the pins as soon as they are created, so this
+        # waits until module_init() knows DEV_Config.so won't take them
+        if self.GPIO_RST_PIN is not None:
+            return
+        import gpiozero
         self.GPIO_RST_PIN    = gpiozero.LED(self.RST_PIN)
         self.GPIO_DC_PIN     = gpiozero.LED(self.DC_PIN)
         # self.GPIO_CS_PIN     = gpiozero.LED(self.CS_PIN)
         self.GPIO_PWR_PIN    = gpiozero.LED(self.PWR_PIN)
         self.GPIO_BUSY_PIN   = gpiozero.Button(self.BUSY_PIN, pull_up = False)
 
-        
+    def _close_gpio(self):
+        if self.GPIO_RST_PIN is None:
+            return
+        self.GPIO_RST_PIN.close()
+        self.GPIO_DC_PIN.close()
+        # self.GPIO_CS_PIN.close()
+        self.GPIO_PWR_PIN.close()
+        self.GPIO_BUSY_PIN.close()
+        self.GPIO_RST_PIN = None
 
     def digital_write(self, pin, value):
-        if pin == self.RST_PIN:
+        if pin != self.CS_PIN:
+            # spidev drives CS itself; DC and RST wait for queued writes
+            self.flush()
+        if self.native:
+            self.DEV_SPI.DEV_Digital_Write(pin, value)
+        elif pin == self.RST_PIN:
             if value:
                 self.GPIO_RST_PIN.on()
             else:
@@ -84,6 +295,9 @@ class RaspberryPi:
                 self.GPIO_PWR_PIN.off()
 
     def digital_read(self, pin):
+        self.flush()
+        if self.native:
+            return self.DEV_SPI.DEV_Digital_Read(pin)
         if pin == self.BUSY_PIN:
             return self.GPIO_BUSY_PIN.value
         elif pin == self.RST_PIN:
@@ -95,14 +309,72 @@ class RaspberryPi:
         elif pin == self.PWR_PIN:
             return self.PWR_PIN.value
 
+    def wait_for_idle(self, pin, busy, timeout=None):
+        """Block until ``pin`` leaves level ``busy``.
+
+        BUSY is a gpiozero Button, so this sleeps on its edge event instead
+        of polling. Raises TimeoutError after ``timeout`` seconds, which
+        defaults to ``busy_timeout``.
+        """
+        self.flush()
+        if timeout is None:
+            timeout = self.busy_timeout
+        if pin != self.BUSY_PIN or self.native:
+            idle = _poll_idle(self.digital_read, pin, busy, timeout)
+        elif busy:
+            idle = self.GPIO_BUSY_PIN.wait_for_release(timeout)
+        else:
+            idle = self.GPIO_BUSY_PIN.wait_for_press(timeout)
+        self._check_idle(idle, timeout)
+
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
     def spi_writebyte(self, data):
-        self.SPI.writebytes(data)
+        self.flush()
+        if self.native:
+            self._native_write(memoryview(bytes(data)))
+        else:
+            self.SPI.writebytes(data)
 
     def spi_writebyte2(self, data):
-        self.SPI.writebytes2(data)
+        if self.native:
+            self._bulk_write(self._native_write, data)
+        else:
+            self._bulk_write(self.SPI.writebytes2, data)
+
+    def _native_write(self, chunk):
+        # a bytearray is passed to C in place; read-only chunks are copied
+        if chunk.readonly:
+            buf = (c_char * len(chunk)).from_buffer_copy(chunk)
+        else:
+            buf = (c_char * len(chunk)).from_buffer(chunk)
+        self.DEV_SPI.DEV_SPI_Write_nByte(buf, len(chunk))
+
+    def set_spi_backend(self, name):
+        """Pick the SPI and GPIO path: 'spidev' (default) or 'native'.
+
+        'native' sends bulk writes through DEV_Config.so's
+        DEV_SPI_Write_nByte and drives the pins through the library too.
+        It is opt-in because the library claims the panel pins and fixes
+        the SPI clock at 10 MHz, so gpiozero, spidev and set_spi_speed()
+        cannot be used alongside it. Drivers that need the library, i.e.
+        call module_init(cleanup=True), get it whatever is set here.
+        Applies from the next module_init().
+        """
+        if name not in ('native', 'spidev'):
+            raise ValueError("Unknown SPI backend %r" % name)
+        type(self).spi_backend = name
+
+    def _load_dev_config(self):
+        if self.DEV_SPI is None:
+            so_filename = _find_library(DEV_CONFIG_SO)
+            if so_filename is None:
+                raise RuntimeError('Cannot find %s' % DEV_CONFIG_SO)
+            lib = CDLL(so_filename)
+            lib.DEV_SPI_Write_nByte.argtypes = [POINTER(c_char), c_uint32]
+            type(self).DEV_SPI = lib
+        return self.DEV_SPI
 
     def DEV_SPI_write(self, data):
         self.DEV_SPI.DEV_SPI_SendData(data)
@@ -114,127 +386,182 @@ class RaspberryPi:
         return self.DEV_SPI.DEV_SPI_ReadData()
 
     def module_init(self, cleanup=False):
-        self.GPIO_PWR_PIN.on()
+        if self.is_open:
+            return 0
         
-        if cleanup:
-            find_dirs = [
-                os.path.dirname(os.path.realpath(__file__)),
-                '/usr/local/lib',
-                '/usr/lib',
-            ]
-            self.DEV_SPI = None
-            for find_dir in find_dirs:
-                val = int(os.popen('getconf LONG_BIT').read())
-                logging.debug("System is %d bit"%val)
-                if val == 64:
-                    so_filename = os.path.join(find_dir, 'DEV_Config_64.so')
-                else:
-                    so_filename = os.path.join(find_dir, 'DEV_Config_32.so')
-                if os.path.exists(so_filename):
-                    self.DEV_SPI = CDLL(so_filename)
-                    break
-            if self.DEV_SPI is None:
-                RuntimeError('Cannot find DEV_Config.so')
-
-            self.DEV_SPI.DEV_Module_Init()
+        if cleanup or self.spi_backend == 'native':
+            # the library opens SPI and claims every panel pin, so release
+            # any gpiozero pins left from an earlier spidev session first
+            self._close_gpio()
+            if self._load_dev_config().DEV_Module_Init() != 0:
+                raise RuntimeError('DEV_Module_Init() failed')
+            self.native = True
+            self.DEV_SPI.DEV_Digital_Write(self.PWR_PIN, 1)
 
         else:
+            self._open_gpio()
+            self.GPIO_PWR_PIN.on()
             # SPI device, bus = 0, device = 0
             self.SPI.open(0, 0)
-            self.SPI.max_speed_hz = 4000000
+            self._set_spi_clock()
             self.SPI.mode = 0b00
+        self.is_open = True
         return 0
 
+    def _set_spi_clock(self):
+        if not self.native:
+            self.SPI.max_speed_hz = self.spi_speed_hz
+
     def module_exit(self, cleanup=False):
+        self.flush()
         logger.debug("spi end")
-        self.SPI.close()
-
-        self.GPIO_RST_PIN.off()
-        self.GPIO_DC_PIN.off()
-        self.GPIO_PWR_PIN.off()
+        self.is_open = False
+        if self.native:
+            self.DEV_SPI.DEV_Digital_Write(self.RST_PIN, 0)
+            self.DEV_SPI.DEV_Digital_Write(self.DC_PIN, 0)
+            self.DEV_SPI.DEV_Digital_Write(self.PWR_PIN, 0)
+            self.native = False
+            self.DEV_SPI.DEV_Module_Exit()
+        elif self.GPIO_RST_PIN is not None:
+            self.SPI.close()
+            self.GPIO_RST_PIN.off()
+            self.GPIO_DC_PIN.off()
+            self.GPIO_PWR_PIN.off()
         logger.debug("close 5V, Module enters 0 power consumption ...")
         
         if cleanup:
-            self.GPIO_RST_PIN.close()
-            self.GPIO_DC_PIN.close()
-            # self.GPIO_CS_PIN.close()
-            self.GPIO_PWR_PIN.close()
-            self.GPIO_BUSY_PIN.close()
+            self._close_gpio()
 
-        
 
 
 
-class JetsonNano:
+class JetsonNano(Backend):
     # Pin definition
     RST_PIN  = 17
     DC_PIN   = 25
     CS_PIN   = 8
     BUSY_PIN = 24
     PWR_PIN  = 18
+    # 'auto' uses the hardware SPI controller when /dev/spidev0.0 exists
+    # (enabled with jetson-io) and bit-bangs through sysfs_software_spi.so
+    # otherwise; 'spidev' and 'software' force one of them
+    spi_backend = 'auto'
+    SPIDEV = '/dev/spidev0.0'
 
     def __init__(self):
-        import ctypes
-        find_dirs = [
-            os.path.dirname(os.path.realpath(__file__)),
-            '/usr/local/lib',
-            '/usr/lib',
-        ]
-        self.SPI = None
-        for find_dir in find_dirs:
-            so_filename = os.path.join(find_dir, 'sysfs_software_spi.so')
-            if os.path.exists(so_filename):
-                self.SPI = ctypes.cdll.LoadLibrary(so_filename)
-                break
-        if self.SPI is None:
-            raise RuntimeError('Cannot find sysfs_software_spi.so')
-
         import Jetson.GPIO
         self.GPIO = Jetson.GPIO
+        self.SPI = None
+        self.hw_spi = None
 
     def digital_write(self, pin, value):
+        if pin == self.CS_PIN and self.hw_spi is not None:
+            # the SPI controller drives CS
+            return
+        self.flush()
         self.GPIO.output(pin, value)
 
     def digital_read(self, pin):
+        self.flush()
         return self.GPIO.input(self.BUSY_PIN)
 
+    def wait_for_idle(self, pin, busy, timeout=None):
+        if timeout is None:
+            timeout = self.busy_timeout
+        self._check_idle(_poll_idle(self.digital_read, pin, busy, timeout), timeout)
+
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
     def spi_writebyte(self, data):
-        self.SPI.SYSFS_software_spi_transfer(data[0])
+        self.flush()
+        if self.hw_spi is not None:
+            self.hw_spi.writebytes(data)
+        else:
+            self.SPI.SYSFS_software_spi_transfer(data[0])
 
     def spi_writebyte2(self, data):
-        for i in range(len(data)):
-            self.SPI.SYSFS_software_spi_transfer(data[i])
+        if self.hw_spi is not None:
+            self._bulk_write(self.hw_spi.writebytes2, data)
+            return
+        # the software SPI library only moves one byte per call
+        transfer = self.SPI.SYSFS_software_spi_transfer
+        for byte in data:
+            transfer(byte)
+
+    def set_spi_backend(self, name):
+        """Pick 'auto', 'spidev' or 'software' SPI, from the next module_init()."""
+        if name not in ('auto', 'spidev', 'software'):
+            raise ValueError("Unknown SPI backend %r" % name)
+        type(self).spi_backend = name
+
+    def _open_spidev(self):
+        if self.spi_backend == 'software' or (self.spi_backend == 'auto' and not os.path.exists(self.SPIDEV)):
+            return None
+        try:
+            import spidev
+        except ImportError:
+            if self.spi_backend == 'spidev':
+                raise
+            return None
+        spi = spidev.SpiDev()
+        # SPI device, bus = 0, device = 0
+        spi.open(0, 0)
+        spi.mode = 0b00
+        return spi
+
+    def _set_spi_clock(self):
+        if self.hw_spi is not None:
+            self.hw_spi.max_speed_hz = self.spi_speed_hz
 
     def module_init(self):
+        if self.is_open:
+            return 0
         self.GPIO.setmode(self.GPIO.BCM)
         self.GPIO.setwarnings(False)
         self.GPIO.setup(self.RST_PIN, self.GPIO.OUT)
         self.GPIO.setup(self.DC_PIN, self.GPIO.OUT)
-        self.GPIO.setup(self.CS_PIN, self.GPIO.OUT)
         self.GPIO.setup(self.PWR_PIN, self.GPIO.OUT)
         self.GPIO.setup(self.BUSY_PIN, self.GPIO.IN)
         
         self.GPIO.output(self.PWR_PIN, 1)
         
-        self.SPI.SYSFS_software_spi_begin()
+        self.hw_spi = self._open_spidev()
+        if self.hw_spi is not None:
+            self.chunk_size = _spidev_bufsiz()
+            self._set_spi_clock()
+        else:
+            if self.SPI is None:
+                so_filename = _find_library('sysfs_software_spi.so')
+                if so_filename is None:
+                    raise RuntimeError('Cannot find sysfs_software_spi.so')
+                self.SPI = CDLL(so_filename)
+            self.GPIO.setup(self.CS_PIN, self.GPIO.OUT)
+            self.SPI.SYSFS_software_spi_begin()
+        self.is_open = True
         return 0
 
     def module_exit(self):
+        self.flush()
         logger.debug("spi end")
-        self.SPI.SYSFS_software_spi_end()
+        self.is_open = False
+        pins = [self.RST_PIN, self.DC_PIN, self.BUSY_PIN, self.PWR_PIN]
+        if self.hw_spi is not None:
+            self.hw_spi.close()
+            self.hw_spi = None
+        else:
+            self.SPI.SYSFS_software_spi_end()
+            pins.append(self.CS_PIN)
 
         logger.debug("close 5V, Module enters 0 power consumption ...")
         self.GPIO.output(self.RST_PIN, 0)
         self.GPIO.output(self.DC_PIN, 0)
         self.GPIO.output(self.PWR_PIN, 0)
 
-        self.GPIO.cleanup([self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN, self.PWR_PIN])
+        self.GPIO.cleanup(pins)
 
 
-class SunriseX3:
+class SunriseX3(Backend):
     # Pin definition
     RST_PIN  = 17
     DC_PIN   = 25
@@ -249,27 +576,35 @@ class SunriseX3:
 
         self.GPIO = Hobot.GPIO
         self.SPI = spidev.SpiDev()
+        self.chunk_size = _spidev_bufsiz()
 
     def digital_write(self, pin, value):
+        self.flush()
         self.GPIO.output(pin, value)
 
     def digital_read(self, pin):
+        self.flush()
         return self.GPIO.input(pin)
 
+    def wait_for_idle(self, pin, busy, timeout=None):
+        if timeout is None:
+            timeout = self.busy_timeout
+        self._check_idle(_poll_idle(self.digital_read, pin, busy, timeout), timeout)
+
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
     def spi_writebyte(self, data):
+        self.flush()
         self.SPI.writebytes(data)
 
     def spi_writebyte2(self, data):
-        # for i in range(len(data)):
-        #     self.SPI.writebytes([data[i]])
-        self.SPI.xfer3(data)
+        self._bulk_write(self.SPI.writebytes2, data)
 
     def module_init(self):
         if self.Flag == 0:
             self.Flag = 1
+            self.is_open = True
             self.GPIO.setmode(self.GPIO.BCM)
             self.GPIO.setwarnings(False)
             self.GPIO.setup(self.RST_PIN, self.GPIO.OUT)
@@ -282,18 +617,23 @@ class SunriseX3:
         
             # SPI device, bus = 0, device = 0
             self.SPI.open(2, 0)
-            self.SPI.max_speed_hz = 4000000
+            self._set_spi_clock()
             self.SPI.mode = 0b00
             return 0
         else:
             return 0
 
+    def _set_spi_clock(self):
+        self.SPI.max_speed_hz = self.spi_speed_hz
+
     def module_exit(self):
+        self.flush()
         logger.debug("spi end")
         self.SPI.close()
 
         logger.debug("close 5V, Module enters 0 power consumption ...")
         self.Flag = 0
+        self.is_open = False
         self.GPIO.output(self.RST_PIN, 0)
         self.GPIO.output(self.DC_PIN, 0)
         self.GPIO.output(self.PWR_PIN, 0)
@@ -301,22 +641,81 @@ class SunriseX3:
         self.GPIO.cleanup([self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN], self.PWR_PIN)
 
 
-if sys.version_info[0] == 2:
-    process = subprocess.Popen("cat /proc/cpuinfo | grep Raspberry", shell=True, stdout=subprocess.PIPE)
-else:
-    process = subprocess.Popen("cat /proc/cpuinfo | grep Raspberry", shell=True, stdout=subprocess.PIPE, text=True)
-output, _ = process.communicate()
-if sys.version_info[0] == 2:
-    output = output.decode(sys.stdout.encoding)
-
-if "Raspberry" in output:
-    implementation = RaspberryPi()
-elif os.path.exists('/sys/bus/platform/drivers/gpio-x3'):
-    implementation = SunriseX3()
-else:
-    implementation = JetsonNano()
+# Backends by platform name; detect_platform() returns one of the keys
+BACKENDS = {
+    'raspberrypi': RaspberryPi,
+    'sunrisex3': SunriseX3,
+    'jetson': JetsonNano,
+}
+
+_backend = None
+_bound = []
+
+
+def _read_text(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read().decode('utf-8', 'replace')
+    except OSError:
+        return ''
+
+
+def detect_platform():
+    """Name of the backend for this board, read from the device tree model."""
+    model = _read_text('/proc/device-tree/model') or _read_text('/proc/cpuinfo')
+    if 'Raspberry' in model:
+        return 'raspberrypi'
+    if os.path.exists('/sys/bus/platform/drivers/gpio-x3'):
+        return 'sunrisex3'
+    return 'jetson'
+
+
+def register_backend(name, cls):
+    """Make ``cls`` selectable with ``set_backend(name)``."""
+    BACKENDS[name] = cls
+
+
+def set_backend(backend):
+    """Route every module level call to ``backend`` from now on.
+
+    ``backend`` is a name in BACKENDS or an object with the Backend
+    interface, e.g. a simulated one. The previous backend is not closed.
+    """
+    global _backend
+    if isinstance(backend, str):
+        backend = BACKENDS[backend]()
+    module = sys.modules[__name__]
+    for name in _bound:
+        delattr(module, name)
+    del _bound[:]
+    _backend = backend
+    # methods and pin constants are bound onto the module, so later
+    # lookups skip __getattr__; state such as is_open or warm_standby
+    # changes after this point and is always read from the backend
+    for name in dir(backend):
+        if name.startswith('_') or name in module.__dict__:
+            continue
+        value = getattr(backend, name)
+        if inspect.isroutine(value) or (name.isupper() and isinstance(value, (int, str))):
+            setattr(module, name, value)
+            _bound.append(name)
+    return backend
+
+
+def get_backend():
+    """The backend in use, constructing the detected one on first use."""
+    if _backend is None:
+        set_backend(detect_platform())
+    return _backend
+
+
+def __getattr__(name):
+    # the first pin or bus access sets up the hardware
+    if not name.startswith('_'):
+        backend = get_backend()
+        if hasattr(backend, name):
+            return getattr(backend, name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
-for func in [x for x in dir(implementation) if not x.startswith('_')]:
-    setattr(sys.modules[__name__], func, getattr(implementation, func))
 
 ### END OF FILE ###
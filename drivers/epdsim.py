@@ -0,0 +1,358 @@
+"""Simulated epdconfig backend for running the drivers without a board.
+
+``SimBackend`` records every command and data byte the driver sends and
+keeps a virtual clock, so delays and busy waits cost no wall time. Given
+a controller model it also emulates the panel's display RAM and BUSY
+timing, and ``image()`` rebuilds the frame that would be shown::
+
+    sim = epdsim.SimBackend(epdsim.SSD1680(122, 250))
+    epdconfig.set_backend(sim)
+    epd = epd2in13_V4.EPD()
+    epd.init()
+    epd.display(epd.getbuffer(image))
+    sim.image()
+
+Two controller families are modelled: ``SSD1680`` for the SSD168x/SSD1681
+panels that write RAM through 0x24/0x26 at a windowed address counter,
+and ``UC8176`` for the UC81xx/IL0398 panels that take whole planes
+through 0x10/0x13, with an optional 0x90 partial window.
+"""
+
+import time
+
+from PIL import Image
+
+from . import epdconfig
+
+
+def _copy_row(ram, stride, height, x, y, data):
+    """Store ``data`` at byte ``x`` of row ``y``, clipped to the RAM."""
+    if 0 <= y < height and x < stride:
+        skip = max(-x, 0)
+        ram[y * stride + x + skip:y * stride + min(x + len(data), stride)] = data[skip:stride - x]
+
+
+class Controller:
+    """Display RAM and BUSY model of one controller family."""
+    # BUSY pin level while the controller is busy
+    busy_level = 1
+    # Command bytes that write display RAM, by plane
+    ram_commands = ()
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.stride = (width + 7) // 8
+        self.planes = dict((cmd, bytearray(b'\xff' * (self.stride * height))) for cmd in self.ram_commands)
+        self.command = None
+        self.params = bytearray()
+        self.refreshes = 0
+
+    def reset(self):
+        """Hardware reset: registers go back to defaults, RAM is kept."""
+        self.command = None
+
+    def write_command(self, command):
+        """Handle a command byte; returns how long BUSY stays asserted, in ms."""
+        self.command = command
+        self.params = bytearray()
+        return 0
+
+    def write_data(self, data):
+        if self.command in self.planes:
+            self.write_ram(self.planes[self.command], data)
+        else:
+            # parameters may come one byte at a time
+            self.params += data
+            self.set_parameters(self.command, self.params)
+
+    def write_ram(self, ram, data):
+        pass
+
+    def set_parameters(self, command, params):
+        """Called with the parameters of ``command`` received so far."""
+
+    def image(self, plane=None, white=1):
+        """The RAM plane ``plane`` as a '1' image, bits equal to ``white`` white."""
+        if plane is None:
+            plane = self.ram_commands[0]
+        buf = bytes(self.planes[plane])
+        if not white:
+            buf = buf.translate(bytes(0xFF ^ i for i in range(256)))
+        return Image.frombytes('1', (self.width, self.height), buf)
+
+
+class SSD1680(Controller):
+    """Solomon SSD1680 family: 0x24 black/white RAM, 0x26 red/old RAM.
+
+    Writes go to the address counter set with 0x4E/0x4F, which moves
+    through the 0x44/0x45 window in the order set with 0x11.
+    """
+    ram_commands = (0x24, 0x26)
+    # BUSY time of a master activation (0x20), for full and partial updates
+    full_update_ms = 2000
+    partial_update_ms = 400
+    reset_ms = 10
+
+    def __init__(self, width, height):
+        super().__init__(width, height)
+        self.reset()
+
+    def reset(self):
+        super().reset()
+        self.entry_mode = 0x03
+        self.window = (0, 0, self.stride - 1, self.height - 1)
+        self.x = 0
+        self.y = 0
+        self.update_mode = 0xF7
+
+    def write_command(self, command):
+        super().write_command(command)
+        if command == 0x12:
+            # software reset
+            self.reset()
+            self.command = command
+            return self.reset_ms
+        if command == 0x20:
+            self.refreshes += 1
+            # display mode 2 (bit 3) is the partial waveform
+            return self.partial_update_ms if self.update_mode & 0x08 else self.full_update_ms
+        return 0
+
+    def set_parameters(self, command, params):
+        if command == 0x11:
+            self.entry_mode = params[0]
+        elif command == 0x22:
+            self.update_mode = params[0]
+        elif command == 0x44 and len(params) >= 2:
+            self.window = (params[0], self.window[1], params[1], self.window[3])
+        elif command == 0x45 and len(params) >= 4:
+            self.window = (self.window[0], params[0] | params[1] << 8, self.window[2], params[2] | params[3] << 8)
+        elif command == 0x4E:
+            self.x = params[0]
+        elif command == 0x4F and len(params) >= 2:
+            self.y = params[0] | params[1] << 8
+
+    def write_ram(self, ram, data):
+        x0, y0, x1, y1 = self.window
+        dx = 1 if self.entry_mode & 0x01 else -1
+        dy = 1 if self.entry_mode & 0x02 else -1
+        # x and y counters run between the window edges in either direction
+        xfirst, xlast = (x0, x1) if dx > 0 else (x1, x0)
+        yfirst, ylast = (y0, y1) if dy > 0 else (y1, y0)
+        x, y = self.x, self.y
+        if self.entry_mode & 0x05 == 0x01 and x0 <= x <= x1:
+            # x increments first: copy up to the window edge at a time
+            start = 0
+            while start < len(data):
+                count = min(x1 - x + 1, len(data) - start)
+                _copy_row(ram, self.stride, self.height, x, y, data[start:start + count])
+                start += count
+                x += count
+                if x > x1:
+                    x = x0
+                    y = yfirst if y == ylast else y + dy
+            self.x, self.y = x, y
+            return
+        for byte in data:
+            if 0 <= x < self.stride and 0 <= y < self.height:
+                ram[y * self.stride + x] = byte
+            if self.entry_mode & 0x04:
+                # AM=1: y is incremented first
+                if y == ylast:
+                    y = yfirst
+                    x = xfirst if x == xlast else x + dx
+                else:
+                    y += dy
+            elif x == xlast:
+                x = xfirst
+                y = yfirst if y == ylast else y + dy
+            else:
+                x += dx
+        self.x, self.y = x, y
+
+
+class UC8176(Controller):
+    """UltraChip UC8176 family: 0x10 old/black plane, 0x13 new/red plane.
+
+    Each plane command starts writing at the top left of the frame, or of
+    the 0x90 window while in partial mode (0x91 until 0x92). BUSY is low
+    while the controller is busy.
+    """
+    busy_level = 0
+    ram_commands = (0x13, 0x10)
+    full_update_ms = 4000
+    partial_update_ms = 800
+    power_on_ms = 100
+    power_off_ms = 20
+
+    def __init__(self, width, height):
+        super().__init__(width, height)
+        self.reset()
+
+    def reset(self):
+        super().reset()
+        self.partial = False
+        self.window = (0, 0, self.stride, self.height)
+        self.offset = 0
+
+    def write_command(self, command):
+        super().write_command(command)
+        self.offset = 0
+        if command == 0x91:
+            self.partial = True
+        elif command == 0x92:
+            self.partial = False
+        elif command == 0x12:
+            self.refreshes += 1
+            return self.partial_update_ms if self.partial else self.full_update_ms
+        elif command == 0x04:
+            return self.power_on_ms
+        elif command == 0x02:
+            return self.power_off_ms
+        return 0
+
+    def set_parameters(self, command, params):
+        if command == 0x90 and len(params) >= 8:
+            x0, x1, y0, y1 = [params[i] << 8 | params[i + 1] for i in range(0, 8, 2)]
+            # x is in pixels on byte boundaries; the end edges are inclusive
+            self.window = (x0 // 8, y0, x1 // 8 + 1, y1 + 1)
+
+    def write_ram(self, ram, data):
+        if self.partial:
+            x0, y0, x1, y1 = self.window
+        else:
+            x0, y0, x1, y1 = 0, 0, self.stride, self.height
+        width = x1 - x0
+        if width <= 0:
+            return
+        start = 0
+        while start < len(data):
+            y, x = divmod(self.offset, width)
+            count = min(width - x, len(data) - start)
+            if y0 + y < y1:
+                _copy_row(ram, self.stride, self.height, x0 + x, y0 + y, data[start:start + count])
+            start += count
+            self.offset += count
+
+
+class SimBackend(epdconfig.Backend):
+    """epdconfig backend that records the SPI stream on a virtual clock.
+
+    ``log`` holds ``[command, data]`` pairs, with the data of consecutive
+    writes merged; ``writes`` and ``bytes_written`` count the SPI calls
+    and bytes. Without a ``controller`` every BUSY read flips the
+    level, which ends the busy loops of either polarity. ``realtime``
+    makes delays and busy waits actually sleep.
+    """
+    RST_PIN  = 17
+    DC_PIN   = 25
+    CS_PIN   = 8
+    BUSY_PIN = 24
+    PWR_PIN  = 18
+    # virtual time one BUSY read takes, so polling loops always advance
+    poll_ms = 1
+
+    def __init__(self, controller=None, realtime=False):
+        self.controller = controller
+        self.realtime = realtime
+        self.log = []
+        self.clock = 0.0
+        self.busy_until = 0.0
+        self.busy_time = 0.0
+        self.bytes_written = 0
+        self.writes = 0
+        self.pins = {}
+        self._flip = 0
+
+    def _advance(self, seconds):
+        if seconds > 0:
+            if self.realtime:
+                time.sleep(seconds)
+            self.clock += seconds
+
+    def _busy(self):
+        return self.clock < self.busy_until
+
+    def digital_write(self, pin, value):
+        if pin == self.RST_PIN and value and not self.pins.get(pin, 1):
+            # rising edge: end of a hardware reset
+            if self.controller is not None:
+                self.controller.reset()
+            self.busy_until = self.clock
+        self.pins[pin] = value
+
+    def digital_read(self, pin):
+        if pin != self.BUSY_PIN:
+            return self.pins.get(pin, 0)
+        self._advance(self.poll_ms / 1000.0)
+        if self.controller is None:
+            self._flip ^= 1
+            return self._flip
+        busy_level = self.controller.busy_level
+        return busy_level if self._busy() else 1 - busy_level
+
+    def wait_for_idle(self, pin, busy, timeout=None):
+        if timeout is None:
+            timeout = self.busy_timeout
+        wait = max(self.busy_until - self.clock, 0) if self.controller is not None else 0
+        if timeout is not None and wait > timeout:
+            self._advance(timeout)
+            self._check_idle(False, timeout)
+        self._advance(wait)
+
+    def delay_ms(self, delaytime):
+        self._advance(delaytime / 1000.0)
+
+    def spi_writebyte(self, data):
+        self._write(data)
+
+    def spi_writebyte2(self, data):
+        self._write(data)
+
+    def _write(self, data):
+        data = bytes(b & 0xFF for b in data) if isinstance(data, list) else bytes(data)
+        self.bytes_written += len(data)
+        self.writes += 1
+        if not self.pins.get(self.DC_PIN, 0):
+            for command in data:
+                self.log.append([command, bytearray()])
+                if self.controller is not None:
+                    busy_ms = self.controller.write_command(command)
+                    if busy_ms:
+                        self.busy_until = self.clock + busy_ms / 1000.0
+                        self.busy_time += busy_ms / 1000.0
+            return
+        if not self.log:
+            self.log.append([None, bytearray()])
+        self.log[-1][1] += data
+        if self.controller is not None:
+            self.controller.write_data(data)
+
+    def DEV_SPI_write(self, data):
+        self._write([data])
+
+    def DEV_SPI_read(self):
+        return 0
+
+    def module_init(self, cleanup=False):
+        self.is_open = True
+        return 0
+
+    def module_exit(self, cleanup=False):
+        self.is_open = False
+
+    def commands(self):
+        """The command bytes sent so far, in order."""
+        return [command for command, _ in self.log]
+
+    def image(self, plane=None, white=1):
+        """The emulated RAM plane as an image; see ``Controller.image``."""
+        if self.controller is None:
+            raise ValueError("No controller is emulated")
+        return self.controller.image(plane, white)
+
+    def clear_log(self):
+        del self.log[:]
+        self.bytes_written = 0
+        self.writes = 0
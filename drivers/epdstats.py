@@ -0,0 +1,107 @@
+"""Per-phase refresh timing for the e-Paper drivers.
+
+``instrument(epd)`` wraps the reset, init, buffer packing, RAM write,
+busy wait, display update and sleep methods of a driver instance, and
+records how long each call takes per panel model. ``stats.summary()``
+reports p50/p95/max for every phase, and a summary line is logged every
+``log_every`` frames.
+"""
+
+import collections
+import functools
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# Driver method names, matched in order, and the phase they are timed as
+_PHASES = [
+    (re.compile(r'reset$'), 'reset'),
+    (re.compile(r'init'), 'init'),
+    # frame planes; epdcommand sends parameter payloads around the timing
+    (re.compile(r'send_data2$'), 'ram_write'),
+    (re.compile(r'getbuffer'), 'pack'),
+    (re.compile(r'(ReadBusy|busy$)'), 'busy'),
+    (re.compile(r'(TurnOnDisplay|turnon_display|ondisplay$)'), 'update'),
+    (re.compile(r'(display|Clear|clear)'), 'frame'),
+    (re.compile(r'sleep$'), 'sleep'),
+]
+
+
+def _percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    return values[max(0, -(-len(values) * pct // 100) - 1)]
+
+
+class RefreshStats:
+    """Recent phase timings per panel model, in seconds."""
+
+    def __init__(self, window=200):
+        self.window = window
+        self.samples = collections.defaultdict(
+            lambda: collections.defaultdict(lambda: collections.deque(maxlen=self.window)))
+        self.frames = collections.Counter()
+
+    def record(self, model, phase, seconds):
+        self.samples[model][phase].append(seconds)
+
+    def summary(self, model=None):
+        """``{model: {phase: {'count', 'p50', 'p95', 'max'}}}``, one model if given."""
+        models = [model] if model is not None else list(self.samples)
+        result = {}
+        for name in models:
+            result[name] = {}
+            for phase, values in self.samples[name].items():
+                values = sorted(values)
+                result[name][phase] = {
+                    'count': len(values),
+                    'p50': _percentile(values, 50),
+                    'p95': _percentile(values, 95),
+                    'max': values[-1],
+                }
+        return result
+
+    def format(self, model):
+        parts = ["%s p50=%.0fms p95=%.0fms max=%.0fms" % (phase, s['p50'] * 1000, s['p95'] * 1000, s['max'] * 1000)
+                 for phase, s in sorted(self.summary(model)[model].items())]
+        return "%s after %d frames: %s" % (model, self.frames[model], ", ".join(parts))
+
+    def reset(self):
+        self.samples.clear()
+        self.frames.clear()
+
+
+stats = RefreshStats()
+
+
+def _timed(func, model, phase, stats, log_every):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stats.record(model, phase, time.perf_counter() - start)
+            if phase == 'sleep':
+                stats.frames[model] += 1
+                if log_every and stats.frames[model] % log_every == 0:
+                    logger.info(stats.format(model))
+    return wrapper
+
+
+def instrument(epd, stats=stats, log_every=10):
+    """Time the phases of driver instance ``epd`` into ``stats``.
+
+    A summary line is logged after every ``log_every`` sleep() calls, i.e.
+    refresh cycles. Returns ``epd`` for chaining.
+    """
+    model = type(epd).__module__.rsplit('.', 1)[-1]
+    for name in dir(type(epd)):
+        if name.startswith('_') or not callable(getattr(type(epd), name)):
+            continue
+        for pattern, phase in _PHASES:
+            if pattern.match(name):
+                setattr(epd, name, _timed(getattr(epd, name), model, phase, stats, log_every))
+                break
+    return epd
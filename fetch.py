@@ -0,0 +1,474 @@
+"""Shared HTTP client for the data sources.
+
+Every fetch goes through one pooled ``requests.Session``, so repeated
+requests to the same host reuse a kept-alive connection instead of paying
+DNS, TCP and TLS setup each time. Responses are negotiated compressed,
+and every request gets a connect/read timeout unless it passes its own.
+
+``HTTPCache`` keeps response bodies on disk, serves them while
+``Cache-Control``/``Expires`` says they are fresh, revalidates them with
+``If-None-Match``/``If-Modified-Since`` after that, and falls back to them
+for a grace period when the upstream fails.
+
+``fetch_all`` runs several ``Source`` fetchers concurrently, each under
+its own deadline, and gathers them into one ``Snapshot``.
+
+``RetryPolicy`` retries failed requests with full-jitter backoff inside a
+time budget, and its ``CircuitBreaker`` stops calling a host that keeps
+failing until a cool-down has passed.
+"""
+
+import asyncio
+import concurrent.futures
+import email.utils
+import functools
+import hashlib
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+# (connect, read) timeout in seconds for requests that do not set one
+DEFAULT_TIMEOUT = (5, 20)
+
+
+def _accept_encoding():
+    """The encodings urllib3 can decode here; br needs a brotli package."""
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        try:
+            import brotlicffi  # noqa: F401
+        except ImportError:
+            return "gzip, deflate"
+    return "gzip, deflate, br"
+
+
+class FetchClient:
+    """A pooled, keep-alive session with default timeouts.
+
+    ``pool_connections`` is how many hosts keep a pool, ``pool_maxsize``
+    how many connections each pool keeps open.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, pool_connections=8, pool_maxsize=4):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Accept-Encoding": _accept_encoding(),
+            "Connection": "keep-alive",
+        })
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+# The client shared by main.py and the test scripts
+client = FetchClient()
+
+
+def get(url, **kwargs):
+    """``requests.get`` through the shared client."""
+    return client.get(url, **kwargs)
+
+
+# Response headers kept with a cached body
+_CACHED_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Cache-Control", "Expires", "Date", "Age")
+
+
+def _cache_control(headers):
+    """``Cache-Control`` directives as a dict, valueless ones mapped to True."""
+    directives = {}
+    for part in headers.get("Cache-Control", "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"') or True
+    return directives
+
+
+def _http_date(value):
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def freshness_lifetime(headers):
+    """Seconds a response stays fresh after it was received; 0 if it is
+    not to be reused without revalidation."""
+    directives = _cache_control(headers)
+    if "no-cache" in directives or "no-store" in directives:
+        return 0
+    try:
+        age = int(headers.get("Age", 0))
+    except ValueError:
+        age = 0
+    for name in ("s-maxage", "max-age"):
+        if name in directives:
+            try:
+                return max(int(directives[name]) - age, 0)
+            except ValueError:
+                return 0
+    expires = _http_date(headers.get("Expires"))
+    if expires is not None:
+        date = _http_date(headers.get("Date")) or time.time()
+        return max(expires - date - age, 0)
+    return 0
+
+
+class HTTPCache:
+    """On-disk cache of GET responses, keyed by the URL with its params.
+
+    ``get`` is the function that does the network request, by default the
+    shared client's. ``stale_if_error`` is how many seconds past its
+    freshness a cached body may still be served when the request raises
+    or returns a 5xx status.
+    """
+
+    def __init__(self, directory, get=None, stale_if_error=3600):
+        self.directory = directory
+        self.fetch = get or client.get
+        self.stale_if_error = stale_if_error
+
+    def _path(self, url):
+        return os.path.join(self.directory, hashlib.sha256(url.encode("utf-8")).hexdigest())
+
+    def load(self, url):
+        """The cached ``(meta, body)`` for ``url``, or None."""
+        path = self._path(url)
+        try:
+            with open(path + ".json") as f:
+                meta = json.load(f)
+            with open(path + ".body", "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url:
+            return None
+        return meta, body
+
+    def store(self, url, response):
+        headers = dict((name, response.headers[name]) for name in _CACHED_HEADERS if name in response.headers)
+        meta = {
+            "url": url,
+            "status": response.status_code,
+            "headers": headers,
+            "encoding": response.encoding,
+            "stored_at": time.time(),
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(url)
+        # body first, so the metadata never points at a partial body
+        self._write(path + ".body", response.content)
+        self._write(path + ".json", json.dumps(meta).encode("utf-8"))
+        return meta
+
+    def _write(self, path, data):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _refresh(self, url, meta, response):
+        """Merge the headers of a 304 into the entry and restart its age."""
+        meta["headers"].update((name, response.headers[name]) for name in _CACHED_HEADERS if name in response.headers)
+        meta["stored_at"] = time.time()
+        self._write(self._path(url) + ".json", json.dumps(meta).encode("utf-8"))
+
+    def _response(self, url, meta, body, source):
+        response = requests.Response()
+        response.status_code = meta["status"]
+        response.headers = CaseInsensitiveDict(meta["headers"])
+        response.encoding = meta.get("encoding")
+        response.url = url
+        response._content = body
+        # "fresh", "revalidated" or "stale"
+        response.from_cache = source
+        return response
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        """GET ``url``, answering from the cache when it may."""
+        url = requests.Request("GET", url, params=params).prepare().url
+        cached = self.load(url)
+        age = None
+        if cached is not None:
+            meta, body = cached
+            age = time.time() - meta["stored_at"]
+            if age < freshness_lifetime(meta["headers"]):
+                return self._response(url, meta, body, "fresh")
+            headers = dict(headers or {})
+            if "ETag" in meta["headers"]:
+                headers["If-None-Match"] = meta["headers"]["ETag"]
+            if "Last-Modified" in meta["headers"]:
+                headers["If-Modified-Since"] = meta["headers"]["Last-Modified"]
+
+        try:
+            response = self.fetch(url, headers=headers, **kwargs)
+        except requests.RequestException as e:
+            if cached is not None and self._usable_stale(meta, age):
+                logger.warning("Serving %s from cache, %.0f s old: %s", url, age, e)
+                return self._response(url, meta, body, "stale")
+            raise
+
+        if cached is not None and response.status_code == 304:
+            self._refresh(url, meta, response)
+            return self._response(url, meta, body, "revalidated")
+        if response.status_code >= 500 and cached is not None and self._usable_stale(meta, age):
+            logger.warning("Serving %s from cache, %.0f s old: HTTP %d", url, age, response.status_code)
+            return self._response(url, meta, body, "stale")
+        if response.status_code == 200 and "no-store" not in _cache_control(response.headers):
+            try:
+                self.store(url, response)
+            except OSError as e:
+                logger.warning("Could not cache %s: %s", url, e)
+        response.from_cache = None
+        return response
+
+    def _usable_stale(self, meta, age):
+        return age <= freshness_lifetime(meta["headers"]) + self.stale_if_error
+
+
+class Source:
+    """A named data source for ``fetch_all``.
+
+    ``fetch`` is a blocking function returning the source's parsed data;
+    it is abandoned if it has not returned after ``deadline`` seconds.
+    """
+
+    def __init__(self, name, fetch, deadline=30):
+        self.name = name
+        self.fetch = fetch
+        self.deadline = deadline
+
+
+class Snapshot:
+    """The results of one ``fetch_all``, by source name.
+
+    A source is either in ``results`` or, if it raised or ran past its
+    deadline, in ``errors``. ``elapsed`` holds each source's seconds.
+    """
+
+    def __init__(self):
+        self.results = {}
+        self.errors = {}
+        self.elapsed = {}
+
+
+_executor = None
+
+
+def _get_executor():
+    # the blocking fetchers run here, sharing the client's connection pools
+    global _executor
+    if _executor is None:
+        _executor = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="fetch")
+    return _executor
+
+
+async def _run_source(source):
+    loop = asyncio.get_running_loop()
+    start = time.monotonic()
+    try:
+        value = await asyncio.wait_for(loop.run_in_executor(_get_executor(), source.fetch), source.deadline)
+        return value, None, time.monotonic() - start
+    except asyncio.TimeoutError:
+        error = TimeoutError("%s took longer than %s s" % (source.name, source.deadline))
+        return None, error, time.monotonic() - start
+    except Exception as e:
+        return None, e, time.monotonic() - start
+
+
+async def gather_sources(sources):
+    """Fetch every source concurrently into a ``Snapshot``."""
+    snapshot = Snapshot()
+    outcomes = await asyncio.gather(*(_run_source(source) for source in sources))
+    for source, (value, error, elapsed) in zip(sources, outcomes):
+        snapshot.elapsed[source.name] = elapsed
+        if error is None:
+            snapshot.results[source.name] = value
+        else:
+            snapshot.errors[source.name] = error
+    return snapshot
+
+
+def fetch_all(sources):
+    """Blocking ``gather_sources``: takes as long as the slowest source."""
+    return asyncio.run(gather_sources(sources))
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of calling a host whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Per-host failure counter that opens after ``failure_threshold``
+    consecutive failed attempts.
+
+    While open, calls to the host fail at once with CircuitOpenError.
+    After ``cooldown`` seconds one trial attempt is let through: success
+    closes the circuit, failure opens it for another cool-down.
+    """
+
+    def __init__(self, failure_threshold=5, cooldown=300, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.failures = {}
+        self.opened_at = {}
+        self.lock = threading.Lock()
+
+    def allow(self, host):
+        """Whether a call to ``host`` would be let through now.
+
+        Unlike ``before()`` this does not start a half-open trial.
+        """
+        with self.lock:
+            opened_at = self.opened_at.get(host)
+            return opened_at is None or self.clock() - opened_at >= self.cooldown
+
+    def before(self, host):
+        with self.lock:
+            opened_at = self.opened_at.get(host)
+            if opened_at is None:
+                return
+            if self.clock() - opened_at < self.cooldown:
+                raise CircuitOpenError("%s is failing, not retried for %.0f s"
+                                       % (host, self.cooldown - (self.clock() - opened_at)))
+            # half open: this attempt is the trial, later ones wait for it
+            self.opened_at[host] = self.clock()
+
+    def success(self, host):
+        with self.lock:
+            self.failures.pop(host, None)
+            self.opened_at.pop(host, None)
+
+    def failure(self, host):
+        with self.lock:
+            self.failures[host] = self.failures.get(host, 0) + 1
+            if self.failures[host] >= self.failure_threshold:
+                if host not in self.opened_at:
+                    logger.warning("Opening circuit for %s after %d failures", host, self.failures[host])
+                self.opened_at[host] = self.clock()
+
+
+def retry_after(response):
+    """Seconds asked for by a ``Retry-After`` header, or None."""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    when = _http_date(value)
+    return None if when is None else max(when - time.time(), 0)
+
+
+class RetryPolicy:
+    """Retries a GET function on connection errors, timeouts and the
+    ``retry_statuses`` HTTP statuses.
+
+    The n-th retry waits a random time up to ``base_delay * 2**(n-1)``,
+    capped at ``max_delay`` (full jitter), or what ``Retry-After`` asks
+    for. Nothing is retried once ``deadline`` seconds have passed since the
+    first attempt, or once ``breaker`` has opened the host's circuit; the
+    last response is returned, or its error raised. Other 4xx statuses are
+    returned at once.
+
+    Use an instance as a decorator on a ``get(url, **kwargs)`` function.
+    """
+    RETRY_STATUSES = frozenset((408, 425, 429, 500, 502, 503, 504))
+
+    def __init__(self, max_attempts=5, base_delay=0.5, max_delay=30, deadline=60,
+                 retry_statuses=RETRY_STATUSES, breaker=None, sleep=time.sleep, clock=time.monotonic):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.retry_statuses = retry_statuses
+        self.breaker = breaker
+        self.sleep = sleep
+        self.clock = clock
+
+    def backoff(self, attempt, response=None):
+        """Seconds to wait after failed attempt number ``attempt``."""
+        if response is not None:
+            asked = retry_after(response)
+            if asked is not None:
+                return asked
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def retryable(self, error):
+        return isinstance(error, (requests.ConnectionError, requests.Timeout)) and not isinstance(error, CircuitOpenError)
+
+    def call(self, func, url, **kwargs):
+        host = urllib.parse.urlsplit(url).netloc
+        start = self.clock()
+        attempt = 0
+        response = error = None
+        while True:
+            if self.breaker is not None:
+                try:
+                    self.breaker.before(host)
+                except CircuitOpenError as e:
+                    # opened by another caller while this one waited
+                    if response is not None:
+                        return response
+                    raise e from error
+            remaining = self.deadline - (self.clock() - start)
+            if "timeout" not in kwargs:
+                # no single attempt may run past the budget
+                attempt_kwargs = dict(kwargs, timeout=tuple(min(t, max(remaining, 0.1)) for t in DEFAULT_TIMEOUT))
+            else:
+                attempt_kwargs = kwargs
+            attempt += 1
+            response = error = None
+            try:
+                response = func(url, **attempt_kwargs)
+            except requests.RequestException as e:
+                if not self.retryable(e):
+                    raise
+                error = e
+            else:
+                if response.status_code not in self.retry_statuses:
+                    if self.breaker is not None:
+                        self.breaker.success(host)
+                    return response
+            if self.breaker is not None:
+                self.breaker.failure(host)
+
+            delay = self.backoff(attempt, response)
+            if (attempt >= self.max_attempts or self.clock() - start + delay > self.deadline
+                    or self.breaker is not None and not self.breaker.allow(host)):
+                if response is not None:
+                    return response
+                raise error
+            logger.info("Retrying %s in %.1f s after %s", url,
+                        delay, error if error is not None else "HTTP %d" % response.status_code)
+            self.sleep(delay)
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(url, **kwargs):
+            return self.call(func, url, **kwargs)
+        return wrapper
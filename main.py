@@ -1,45 +1,37 @@
 from PIL import Image, ImageDraw, ImageFont
 import time, datetime
-from time import sleep
 import sys, os, platform
 basedir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(basedir)
 import threading
 import queue
-import requests
-import functools
-from typing import Callable, Tuple, Type
-
-
-def retry(max_attempts: int = 5, backoff_factor: float = 0.2, exceptions: Tuple[Type[BaseException], ...] = (Exception,)):
-    """Decorator to retry a function up to `max_attempts` with exponential backoff.
-
-    backoff_factor is the initial delay in seconds; delay doubles each retry.
-    ``exceptions`` is a tuple of exception classes that should trigger a retry.
-    """
-    def decorator(func: Callable):
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            attempt = 1
-            delay = backoff_factor
-            while True:
-                try:
-                    return func(*args, **kwargs)
-                except exceptions:
-                    if attempt >= max_attempts:
-                        raise
-                    time.sleep(delay)
-                    delay *= 2
-                    attempt += 1
-        return wrapper
-    return decorator
-
-
-# A small wrapper around requests.get that will retry on request exceptions
-@retry(max_attempts=5, backoff_factor=0.2, exceptions=(requests.RequestException,))
+import hashlib
+import logging
+import fetch
+import scheduler
+
+
+# Connection errors, timeouts, 429 and 5xx are retried with jittered
+# backoff for up to 45 s; a host that fails 5 times in a row is left alone
+# for 5 minutes, during which the cache serves stale data if it has any
+retry_policy = fetch.RetryPolicy(max_attempts=5, base_delay=0.5, max_delay=15, deadline=45,
+                                 breaker=fetch.CircuitBreaker(failure_threshold=5, cooldown=300))
+
+# GET through the shared keep-alive session
+@retry_policy
+def _fetch(url, **kwargs):
+    print(f" Fetching {url} at {datetime.datetime.now()}")
+    return fetch.get(url, **kwargs)
+
+# Responses are cached on disk and revalidated; when the upstream fails,
+# a cached body up to an hour past its freshness is used instead
+http_cache = fetch.HTTPCache(os.path.join(basedir, "cache", "http"), get=_fetch, stale_if_error=3600)
+
 def _get(url, **kwargs):
-    print(f" Fetching {url} with params {kwargs.get('params', {})} at {datetime.datetime.now()}")
-    return requests.get(url, **kwargs)
+    response = http_cache.get(url, **kwargs)
+    if response.from_cache:
+        print(f" {response.from_cache.capitalize()} cached response for {url} at {datetime.datetime.now()}")
+    return response
 
 def is_sim_mode() -> bool:
     if sys.platform.startswith("linux") and platform.machine().startswith(("arm", "aarch")):
@@ -52,7 +44,7 @@ if sim_mode:
     import tkinter as tk
     from PIL import ImageTk
 else: 
-    from drivers import epd2in13_V4
+    from drivers import epd2in13_V4, epdbuffer, epdconfig, epdstats
 
 # Queue for image updates
 image_queue = queue.Queue()
@@ -62,6 +54,31 @@ longitude = -93.2667
 wind_unit = "mph" # kmh, ms, mph, kn
 temp_unit = "fahrenheit" # celsius, fahrenheit
 
+# Frames that change at most this fraction of the panel get a partial
+# refresh; once full_refresh_interval seconds have passed since the last
+# full refresh, the next one is full to clear the ghosting partials leave
+# behind. Counting time rather than partials keeps the flashes as rare
+# however often the frame changes.
+partial_max_area = 0.5
+full_refresh_interval = 2 * 3600
+
+# Seconds a busy wait may take before the refresh is abandoned
+busy_timeout = 30
+
+# Keep SPI and GPIO open between refreshes instead of powering the HAT down
+warm_standby = True
+
+# SPI clock in Hz; the 2.13" V4 controller takes writes at up to 20 MHz
+spi_speed_hz = 10000000
+
+# Each source is fetched on quarter hour boundaries, up to fetch_jitter
+# seconds late; the clock is redrawn every clock_interval seconds in
+# between, which the small dirty area turns into a partial refresh. The
+# clock job only runs on panels whose driver has displayPartial()
+fetch_interval = 900
+fetch_jitter = 30
+clock_interval = 60
+
 temp_str = "°C" if temp_unit == "celsius" else "°F"
 wind_str = {"kmh": "KM/H", "ms": "M/S", "mph": "MPH", "kn": "knots"}[wind_unit]
 
@@ -101,6 +118,20 @@ weather_data = {}
 
 is_night = False
 
+# Held while a fetch updates the weather globals or draw() reads them
+data_lock = threading.Lock()
+
+# Pipeline between the fetch/clock jobs, the renderer and the panel
+render_queue = scheduler.LatestQueue()
+refresh_queue = scheduler.LatestQueue()
+
+last_buffer = None
+last_full_refresh = None
+
+# Digest of the last frame shown, and how many identical frames were skipped
+last_digest = None
+refreshes_skipped = 0
+
 fnt_dejavu_12 = ImageFont.truetype(basedir + '/assets/fonts/dejavu_sans_mono.ttf', 12)
 
 fnt_dejavu_18= ImageFont.truetype(basedir + '/assets/fonts/dejavu_sans_mono.ttf', 18)
@@ -133,6 +164,10 @@ def draw_text(image, text, x, y, halign, valign, font):
     return image
 
 def draw():
+    with data_lock:
+        return _draw()
+
+def _draw():
     image = Image.new("RGB", (250, 122), "white")
     global weather_data
     
@@ -156,24 +191,41 @@ def draw():
             image = Image.eval(image, lambda x: 255 - x)
     return image
 
-def tick():
-    # Fetch weather data
+def fetch_weather():
+    response = _get("https://api.open-meteo.com/v1/forecast", params={
+        "latitude": 44.9833,
+        "longitude": -93.2667,
+        "current": "weather_code,temperature_2m,apparent_temperature,relative_humidity_2m,windspeed_10m,wind_gusts_10m,winddirection_10m",
+        "wind_speed_unit": wind_unit,
+        "temperature_unit": temp_unit,
+        "daily": "sunrise,sunset",
+        "timezone": datetime.datetime.now().astimezone().tzinfo,
+        "forecast_days": 1
+    })
+    return response.json()
+
+# Data sources, fetched together each slot, each under its own deadline
+sources = [
+    fetch.Source("weather", fetch_weather, deadline=60),
+]
+
+def fetch_sources():
+    """Fetch every source concurrently and queue one redraw with the new data."""
+    snapshot = fetch.fetch_all(sources)
+    # applied in one go, so a frame never mixes old and new snapshots
+    with data_lock:
+        for source in sources:
+            source_handlers[source.name](snapshot)
+    render_queue.put("fetch")
+
+def apply_weather(snapshot):
     global weather_data
     global is_night
-    
+
     try:
-        response = _get("https://api.open-meteo.com/v1/forecast", params={
-            "latitude": 44.9833,
-            "longitude": -93.2667,
-            "current": "weather_code,temperature_2m,apparent_temperature,relative_humidity_2m,windspeed_10m,wind_gusts_10m,winddirection_10m",
-            "wind_speed_unit": wind_unit,
-            "temperature_unit": temp_unit,
-            "daily": "sunrise,sunset",
-            "timezone": datetime.datetime.now().astimezone().tzinfo,
-            "forecast_days": 1
-        })
-
-        data = response.json()
+        if "weather" in snapshot.errors:
+            raise snapshot.errors["weather"]
+        data = snapshot.results["weather"]
         weather_data = data.get("current", {})
         
         if datetime.datetime.fromisoformat(data["daily"]["sunrise"][0]).astimezone() < datetime.datetime.now().astimezone() < datetime.datetime.fromisoformat(data["daily"]["sunset"][0]).astimezone():
@@ -184,34 +236,83 @@ def tick():
     except Exception as e:
         print(f"Error fetching weather data: {e} at {datetime.datetime.now()}")
         weather_data = {"error": str(e)}
-    
-    buffer = draw()
-    display_image(buffer)
+
+# Apply a snapshot of each source to the globals draw() reads
+source_handlers = {
+    "weather": apply_weather,
+}
+
+def render(reason):
+    if not weather_data:
+        # nothing fetched yet; the fetch queues a render when it is done
+        return None
+    return draw()
 
 def main():
-    tick()
-    # Fire the tick() function at the start of each hour (system time)
-    while True:
-        now = time.time()
-        sleep_time = 900 - (now % 900)
-        time.sleep(sleep_time)
-        tick()
+    jobs = scheduler.Scheduler()
+    jobs.add_job("fetch", fetch_sources, fetch_interval,
+                 jitter=fetch_jitter, align=True, missed="run_once", run_at_start=True)
+    if clock_interval and (sim_mode or hasattr(epd, "displayPartial")):
+        jobs.add_job("clock", lambda: render_queue.put("clock"), clock_interval, align=True, missed="skip")
+    jobs.add_stage("render", render, render_queue, refresh_queue)
+    jobs.add_stage("refresh", display_image, refresh_queue)
+    jobs.run()
 
 def display_image(image):
+    global last_buffer
+    global last_digest
+    global refreshes_skipped
+
+    frame = image.tobytes() if sim_mode else epd.getbuffer(image.transpose(Image.ROTATE_180))
+    digest = hashlib.blake2b(frame, digest_size=16).digest()
+    if digest == last_digest:
+        refreshes_skipped += 1
+        print(f"Frame unchanged, skipped refresh ({refreshes_skipped} skipped so far) at {datetime.datetime.now()}")
+        return
+
     if sim_mode:
         # Put the image in the queue for the UI thread
         image_queue.put(image)
+    else:
+        try:
+            push_buffer(frame)
+        except Exception as e:
+            # the panel state is unknown, so redraw it fully next time
+            last_buffer = None
+            last_digest = None
+            if not isinstance(e, TimeoutError):
+                raise
+            print(f"Error refreshing display: {e} at {datetime.datetime.now()}")
+            return
+    # only a frame that reached the panel counts as shown
+    last_digest = digest
+
+def push_buffer(buffer):
+    """Send a packed frame to the panel, partially refreshing small changes."""
+    global last_buffer
+    global last_full_refresh
+
+    rect = epdbuffer.dirty_rect(last_buffer, buffer, epdbuffer.linewidth(epd.width))
+    area = epdbuffer.rect_area(rect) if rect is not None else 0
+    now = time.monotonic()
+    if (last_buffer is not None and now - last_full_refresh < full_refresh_interval
+            and area <= partial_max_area * len(buffer)):
+        # the panel may have lost its RAM while asleep, so reload the old frame
+        epd.init()
+        epd.displayPartial(buffer, base=last_buffer)
     else:
         epd.init_fast()
-        epd.display(epd.getbuffer(image.rotate(180)))
-        epd.sleep()
+        epd.display(buffer)
+        last_full_refresh = now
+    epd.sleep()
+    last_buffer = buffer
 
 if __name__ == "__main__":
     if sim_mode:
         def main_thread():
             main()
 
-        # Start main/tick in a background thread
+        # Run the scheduler in a background thread
         t = threading.Thread(target=main_thread, daemon=True)
         t.start()
 
@@ -237,5 +338,12 @@ if __name__ == "__main__":
         root.after(100, poll_queue)
         root.mainloop()
     else:
-        epd = epd2in13_V4.EPD()
-        main()
\ No newline at end of file
+        logging.basicConfig(level=logging.INFO)
+        epdconfig.set_busy_timeout(busy_timeout)
+        epdconfig.set_warm_standby(warm_standby)
+        epdconfig.set_spi_speed(spi_speed_hz)
+        epd = epdstats.instrument(epd2in13_V4.EPD())
+        try:
+            main()
+        finally:
+            epdconfig.module_exit()
\ No newline at end of file
@@ -1,8 +1,8 @@
-import requests
+import fetch
 
 # fetch current METAR for KMSP
 icao_code = "KMSP"
-response = requests.get(f"https://aviationweather.gov/api/data/metar?ids={icao_code}&hours=0&sep=true")
+response = fetch.get(f"https://aviationweather.gov/api/data/metar?ids={icao_code}&hours=0&sep=true")
 
 if response.status_code == 200:
     metar_data = response.text
@@ -0,0 +1,161 @@
+"""Periodic jobs and pipeline stages, each on its own thread.
+
+A ``Job`` calls a function on a fixed interval, optionally aligned to
+wall-clock multiples of it, with random jitter and a policy for runs that
+were missed while the previous one overran. A stage takes items from a
+``LatestQueue``, processes them and may pass the result on to the next
+queue, so a slow stage never holds up the jobs feeding it.
+"""
+
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# What a job does about slots that passed while it was still running:
+# skip them, run once for all of them, or run once for each
+MISSED_POLICIES = ('skip', 'run_once', 'catch_up')
+
+
+class LatestQueue:
+    """Single-slot queue: ``put`` replaces an item not yet taken.
+
+    A stage that falls behind only ever sees the latest item.
+    """
+
+    def __init__(self):
+        self.item = None
+        self.full = False
+        self.cond = threading.Condition()
+
+    def put(self, item):
+        with self.cond:
+            if self.full:
+                logger.debug("Dropping unconsumed %r", self.item)
+            self.item = item
+            self.full = True
+            self.cond.notify()
+
+    def get(self, timeout=None):
+        """The next item; raises TimeoutError if none comes in ``timeout`` s."""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.full, timeout):
+                raise TimeoutError("No item within %s s" % timeout)
+            item, self.item, self.full = self.item, None, False
+            return item
+
+
+class Job:
+    """``func()`` every ``interval`` seconds.
+
+    With ``align`` the runs fall on multiples of ``interval`` in wall-clock
+    time (900: on the quarter hour), else they count from the first run.
+    Each run starts up to ``jitter`` seconds late at random. ``missed`` is
+    one of MISSED_POLICIES. ``run_at_start`` runs the job once right away.
+    """
+
+    def __init__(self, name, func, interval, jitter=0, align=False, missed='skip', run_at_start=False):
+        if missed not in MISSED_POLICIES:
+            raise ValueError("Unknown missed-run policy %r" % missed)
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.align = align
+        self.missed = missed
+        self.run_at_start = run_at_start
+
+    def next_slot(self, slot):
+        if self.align:
+            return (slot // self.interval + 1) * self.interval
+        return slot + self.interval
+
+    def after_run(self, slot, now):
+        """The slot to run next, given the one just run finished at ``now``."""
+        nxt = self.next_slot(slot)
+        if nxt > now or self.missed == 'catch_up':
+            return nxt
+        # the last slot that has already passed
+        latest = nxt + (now - nxt) // self.interval * self.interval
+        if self.missed == 'run_once':
+            return latest
+        return self.next_slot(latest)
+
+    def run(self, stop):
+        now = time.time()
+        slot = now if self.run_at_start else self.next_slot(now)
+        while True:
+            delay = slot + random.uniform(0, self.jitter) - time.time()
+            if stop.wait(max(delay, 0)):
+                return
+            try:
+                self.func()
+            except Exception:
+                logger.exception("Job %s failed", self.name)
+            slot = self.after_run(slot, time.time())
+
+
+class Stage:
+    """Calls ``func(item)`` for every item from ``inbox``, and puts each
+    result other than None into ``outbox``."""
+
+    def __init__(self, name, func, inbox, outbox=None):
+        self.name = name
+        self.func = func
+        self.inbox = inbox
+        self.outbox = outbox
+
+    def run(self, stop):
+        while not stop.is_set():
+            try:
+                item = self.inbox.get(timeout=1)
+            except TimeoutError:
+                continue
+            try:
+                result = self.func(item)
+            except Exception:
+                logger.exception("Stage %s failed", self.name)
+                continue
+            if self.outbox is not None and result is not None:
+                self.outbox.put(result)
+
+
+class Scheduler:
+    """Runs jobs and stages on daemon threads until ``stop()``."""
+
+    def __init__(self):
+        self.workers = []
+        self.threads = []
+        self.stopping = threading.Event()
+
+    def add_job(self, *args, **kwargs):
+        job = Job(*args, **kwargs)
+        self.workers.append(job)
+        return job
+
+    def add_stage(self, *args, **kwargs):
+        stage = Stage(*args, **kwargs)
+        self.workers.append(stage)
+        return stage
+
+    def start(self):
+        for worker in self.workers:
+            thread = threading.Thread(target=worker.run, args=(self.stopping,), name=worker.name, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def run(self):
+        """Start every worker and block until ``stop()`` or Ctrl-C."""
+        self.start()
+        try:
+            self.stopping.wait()
+        finally:
+            self.stop()
+
+    def stop(self, timeout=5):
+        self.stopping.set()
+        for thread in self.threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout)
@@ -0,0 +1,124 @@
+import pytest
+import requests
+
+import fetch
+
+URL = "http://example.com/forecast"
+
+
+def make_response(status=200, body=b'{"t": 1}', **headers):
+    response = requests.Response()
+    response.status_code = status
+    response._content = body
+    response.headers.update(headers)
+    response.encoding = "utf-8"
+    return response
+
+
+class FakeGet:
+    """Stands in for the network: returns or raises the queued results."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = []
+
+    def __call__(self, url, headers=None, **kwargs):
+        self.calls.append((url, dict(headers or {})))
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000000.0]
+    monkeypatch.setattr(fetch.time, "time", lambda: now[0])
+    return now
+
+
+def test_fresh_response_is_served_without_a_request(tmp_path, clock):
+    get = FakeGet(make_response(**{"Cache-Control": "max-age=60"}))
+    cache = fetch.HTTPCache(str(tmp_path), get=get)
+    assert cache.get(URL).from_cache is None
+    clock[0] += 59
+    response = cache.get(URL)
+    assert response.from_cache == "fresh"
+    assert response.json() == {"t": 1}
+    assert len(get.calls) == 1
+
+
+def test_expired_response_is_revalidated_with_a_304(tmp_path, clock):
+    get = FakeGet(make_response(ETag='"v1"', **{"Last-Modified": "Sat, 17 Oct 2026 10:00:00 GMT",
+                                                "Cache-Control": "max-age=60"}),
+                  make_response(304, b"", ETag='"v1"', **{"Cache-Control": "max-age=120"}))
+    cache = fetch.HTTPCache(str(tmp_path), get=get)
+    cache.get(URL)
+    clock[0] += 61
+    response = cache.get(URL)
+    assert response.from_cache == "revalidated"
+    assert response.status_code == 200
+    assert response.json() == {"t": 1}
+    assert get.calls[1][1] == {"If-None-Match": '"v1"', "If-Modified-Since": "Sat, 17 Oct 2026 10:00:00 GMT"}
+    # the 304 restarted the entry's age with its new max-age
+    clock[0] += 119
+    assert cache.get(URL).from_cache == "fresh"
+    assert len(get.calls) == 2
+
+
+def test_changed_response_replaces_the_entry(tmp_path, clock):
+    get = FakeGet(make_response(ETag='"v1"'), make_response(body=b'{"t": 2}', ETag='"v2"'))
+    cache = fetch.HTTPCache(str(tmp_path), get=get)
+    cache.get(URL)
+    response = cache.get(URL)
+    assert response.from_cache is None
+    assert response.json() == {"t": 2}
+    meta, body = cache.load(URL)
+    assert meta["headers"]["ETag"] == '"v2"'
+    assert body == b'{"t": 2}'
+
+
+def test_stale_entry_is_served_when_the_request_fails(tmp_path, clock):
+    get = FakeGet(make_response(**{"Cache-Control": "max-age=60"}),
+                  requests.ConnectionError("refused"),
+                  make_response(503, b""))
+    cache = fetch.HTTPCache(str(tmp_path), get=get, stale_if_error=600)
+    cache.get(URL)
+    clock[0] += 600
+    assert cache.get(URL).from_cache == "stale"
+    response = cache.get(URL)
+    assert response.from_cache == "stale"
+    assert response.json() == {"t": 1}
+
+
+def test_entry_past_stale_if_error_is_not_served(tmp_path, clock):
+    get = FakeGet(make_response(**{"Cache-Control": "max-age=60"}),
+                  requests.ConnectionError("refused"),
+                  make_response(503, b""))
+    cache = fetch.HTTPCache(str(tmp_path), get=get, stale_if_error=600)
+    cache.get(URL)
+    clock[0] += 661
+    with pytest.raises(requests.ConnectionError):
+        cache.get(URL)
+    response = cache.get(URL)
+    assert response.status_code == 503
+    assert response.from_cache is None
+
+
+def test_no_store_response_is_not_cached(tmp_path, clock):
+    get = FakeGet(make_response(**{"Cache-Control": "no-store"}), make_response())
+    cache = fetch.HTTPCache(str(tmp_path), get=get)
+    cache.get(URL)
+    assert cache.load(URL) is None
+    cache.get(URL)
+    assert len(get.calls) == 2
+
+
+def test_params_are_part_of_the_key(tmp_path, clock):
+    get = FakeGet(make_response(**{"Cache-Control": "max-age=60"}),
+                  make_response(body=b'{"t": 2}', **{"Cache-Control": "max-age=60"}))
+    cache = fetch.HTTPCache(str(tmp_path), get=get)
+    cache.get(URL, params={"a": 1})
+    assert cache.get(URL, params={"a": 2}).json() == {"t": 2}
+    assert cache.get(URL, params={"a": 1}).json() == {"t": 1}
+    assert get.calls[0][0] == URL + "?a=1"
@@ -0,0 +1,49 @@
+from drivers import epdbuffer
+
+STRIDE = 4
+HEIGHT = 6
+
+
+def frame(*changes):
+    """A white frame with ``(x, y, value)`` bytes set."""
+    buf = bytearray(b'\xff' * (STRIDE * HEIGHT))
+    for x, y, value in changes:
+        buf[y * STRIDE + x] = value
+    return buf
+
+
+def test_dirty_rect_equal_frames():
+    assert epdbuffer.dirty_rect(frame(), frame(), STRIDE) is None
+
+
+def test_dirty_rect_without_old_frame_is_whole_frame():
+    assert epdbuffer.dirty_rect(None, frame(), STRIDE) == (0, 0, STRIDE, HEIGHT)
+
+
+def test_dirty_rect_size_change_is_whole_frame():
+    assert epdbuffer.dirty_rect(frame()[:-STRIDE], frame(), STRIDE) == (0, 0, STRIDE, HEIGHT)
+
+
+def test_dirty_rect_first_row_first_byte():
+    assert epdbuffer.dirty_rect(frame(), frame((0, 0, 0x7F)), STRIDE) == (0, 0, 1, 1)
+
+
+def test_dirty_rect_last_row_last_byte():
+    rect = epdbuffer.dirty_rect(frame(), frame((STRIDE - 1, HEIGHT - 1, 0xFE)), STRIDE)
+    assert rect == (STRIDE - 1, HEIGHT - 1, STRIDE, HEIGHT)
+
+
+def test_dirty_rect_spans_changes_in_different_rows():
+    rect = epdbuffer.dirty_rect(frame(), frame((2, 1, 0x00), (1, 4, 0x0F)), STRIDE)
+    assert rect == (1, 1, 3, 5)
+    assert epdbuffer.rect_area(rect) == 8
+
+
+def test_dirty_rect_first_and_last_rows():
+    rect = epdbuffer.dirty_rect(frame(), frame((1, 0, 0x00), (2, HEIGHT - 1, 0x00)), STRIDE)
+    assert rect == (1, 0, 3, HEIGHT)
+
+
+def test_dirty_rect_single_bit_in_middle_byte():
+    rect = epdbuffer.dirty_rect(frame(), frame((2, 3, 0xFF ^ 0x10)), STRIDE)
+    assert rect == (2, 3, 3, 4)
@@ -0,0 +1,165 @@
+import sys
+
+import pytest
+
+from drivers import epdconfig, epdsim
+
+
+class Sim(epdsim.SimBackend):
+    """Simulated backend that counts how often the bus is opened and closed."""
+
+    def __init__(self):
+        super().__init__(epdsim.SSD1680(122, 250))
+        self.inits = 0
+        self.exits = 0
+
+    def module_init(self, cleanup=False):
+        if not self.is_open:
+            self.inits += 1
+        return super().module_init(cleanup)
+
+    def module_exit(self, cleanup=False):
+        self.exits += 1
+        super().module_exit(cleanup)
+
+
+@pytest.fixture
+def sim():
+    # set_warm_standby() sets a class attribute, so each test gets its own class
+    backend = type('Sim', (Sim,), {})()
+    epdconfig.set_backend(backend)
+    return backend
+
+
+def test_standby_without_warm_standby_closes_the_bus(sim):
+    sim.module_init()
+    epdconfig.module_standby(2000)
+    assert sim.exits == 1
+    assert not sim.is_open
+    # the panel is given its settle time before the power is cut
+    assert sim.clock == pytest.approx(2.0)
+
+
+def test_warm_standby_keeps_the_bus_open(sim):
+    epdconfig.set_warm_standby(True)
+    sim.module_init()
+    epdconfig.module_standby(2000)
+    assert sim.exits == 0
+    assert sim.is_open
+    assert sim.clock == 0
+
+
+def test_warm_standby_can_be_turned_off_again(sim):
+    epdconfig.set_warm_standby(True)
+    epdconfig.set_warm_standby(False)
+    sim.module_init()
+    epdconfig.module_standby(2000)
+    assert sim.exits == 1
+
+
+def test_driver_sleep_in_warm_standby_skips_reopening(sim):
+    from drivers import epd2in13_V4
+
+    epdconfig.set_warm_standby(True)
+    epd = epd2in13_V4.EPD()
+    for _ in range(3):
+        epd.init()
+        epd.Clear(0xFF)
+        epd.sleep()
+    assert sim.inits == 1
+    assert sim.exits == 0
+    assert sim.commands()[-1] == 0x10
+    epdconfig.module_exit()
+    assert not sim.is_open
+
+
+def test_driver_sleep_without_warm_standby_powers_down_each_time(sim):
+    from drivers import epd2in13_V4
+
+    epd = epd2in13_V4.EPD()
+    for _ in range(3):
+        epd.init()
+        epd.Clear(0xFF)
+        epd.sleep()
+    assert sim.inits == 3
+    assert sim.exits == 3
+
+
+class Recorder:
+    """Stands in for spidev, gpiozero and DEV_Config.so, logging each call."""
+
+    def __init__(self, log, name):
+        self.log = log
+        self.name = name
+
+    def __call__(self, *args, **kwargs):
+        self.log.append((self.name,) + args)
+        return Recorder(self.log, self.name + '()')
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return Recorder(self.log, self.name + '.' + name)
+
+
+@pytest.fixture
+def pi(monkeypatch):
+    log = []
+    monkeypatch.setitem(sys.modules, 'spidev', Recorder(log, 'spidev'))
+    monkeypatch.setitem(sys.modules, 'gpiozero', Recorder(log, 'gpiozero'))
+    lib = Recorder(log, 'lib')
+    lib.DEV_Module_Init = lambda: log.append(('lib.DEV_Module_Init',)) or 0
+    monkeypatch.setattr(epdconfig, '_find_library', lambda name: '/usr/lib/' + name)
+    monkeypatch.setattr(epdconfig, 'CDLL', lambda path: lib)
+    # spi_backend and DEV_SPI are class attributes
+    backend = type('RaspberryPi', (epdconfig.RaspberryPi,), {})()
+    return backend, log
+
+
+def test_pi_defaults_to_spidev_and_gpiozero(pi):
+    backend, log = pi
+    backend.module_init()
+    assert not backend.native
+    assert not any(call[0].startswith('lib') for call in log)
+    assert any(call[0] == 'gpiozero.LED' for call in log)
+
+
+def test_pi_drivers_needing_the_library_get_the_native_path(pi):
+    backend, log = pi
+    backend.module_init(cleanup=True)
+    assert backend.native
+    assert ('lib.DEV_Module_Init',) in log
+    # the library owns the pins, so gpiozero and spidev are never opened
+    assert not any(call[0].startswith('gpiozero') or '.open' in call[0] for call in log)
+    backend.digital_write(backend.DC_PIN, 1)
+    assert log[-1] == ('lib.DEV_Digital_Write', backend.DC_PIN, 1)
+
+
+def test_pi_native_opt_in(pi):
+    backend, log = pi
+    backend.set_spi_backend('native')
+    backend.module_init()
+    assert backend.native
+    with pytest.raises(ValueError):
+        backend.set_spi_backend('auto')
+
+
+def test_backend_state_is_read_live(sim):
+    assert not epdconfig.is_open
+    epdconfig.module_init()
+    assert epdconfig.is_open
+    epdconfig.module_exit()
+    assert not epdconfig.is_open
+    epdconfig.set_warm_standby(True)
+    assert epdconfig.warm_standby
+    epdconfig.set_busy_timeout(3)
+    assert epdconfig.busy_timeout == 3
+
+
+def test_set_backend_binds_methods_and_pins_only(sim):
+    assert epdconfig.__dict__['module_init'] == sim.module_init
+    assert epdconfig.__dict__['RST_PIN'] == sim.RST_PIN
+    assert 'is_open' not in epdconfig.__dict__
+    assert 'warm_standby' not in epdconfig.__dict__
+    with pytest.raises(AttributeError):
+        epdconfig.no_such_attribute
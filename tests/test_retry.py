@@ -0,0 +1,209 @@
+import pytest
+import requests
+
+import fetch
+
+URL = "http://api.example.com/v1/forecast"
+HOST = "api.example.com"
+
+
+def make_response(status, **headers):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers)
+    return response
+
+
+class Clock:
+    """Fake monotonic clock; sleeping advances it."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeGet:
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    def __call__(self, url, **kwargs):
+        self.calls += 1
+        result = self.results.pop(0) if len(self.results) > 1 else self.results[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def policy(clock, **kwargs):
+    kwargs.setdefault("max_attempts", 4)
+    kwargs.setdefault("deadline", 60)
+    return fetch.RetryPolicy(sleep=clock.sleep, clock=clock, **kwargs)
+
+
+def test_503_is_retried_until_it_succeeds():
+    clock = Clock()
+    get = FakeGet(make_response(503), make_response(503), make_response(200))
+    assert policy(clock).call(get, URL).status_code == 200
+    assert get.calls == 3
+    assert len(clock.sleeps) == 2
+
+
+def test_404_is_returned_at_once():
+    clock = Clock()
+    get = FakeGet(make_response(404))
+    assert policy(clock).call(get, URL).status_code == 404
+    assert get.calls == 1
+    assert clock.sleeps == []
+
+
+def test_last_503_is_returned_after_max_attempts():
+    clock = Clock()
+    get = FakeGet(make_response(503))
+    assert policy(clock).call(get, URL).status_code == 503
+    assert get.calls == 4
+    assert len(clock.sleeps) == 3
+
+
+def test_backoff_is_capped_full_jitter():
+    clock = Clock()
+    get = FakeGet(requests.ConnectionError("refused"))
+    with pytest.raises(requests.ConnectionError):
+        policy(clock, max_attempts=6, base_delay=1, max_delay=4).call(get, URL)
+    for attempt, delay in enumerate(clock.sleeps, 1):
+        assert 0 <= delay <= min(4, 2 ** (attempt - 1))
+
+
+def test_retry_after_is_honoured():
+    clock = Clock()
+    get = FakeGet(make_response(429, **{"Retry-After": "7"}), make_response(200))
+    assert policy(clock).call(get, URL).status_code == 200
+    assert clock.sleeps == [7.0]
+
+
+def test_retry_after_beyond_the_deadline_returns_without_waiting():
+    clock = Clock()
+    get = FakeGet(make_response(503, **{"Retry-After": "120"}), make_response(200))
+    assert policy(clock, deadline=60).call(get, URL).status_code == 503
+    assert get.calls == 1
+    assert clock.sleeps == []
+
+
+def test_attempt_timeout_is_capped_by_the_remaining_budget():
+    clock = Clock()
+    timeouts = []
+
+    def get(url, timeout):
+        timeouts.append(timeout)
+        clock.now += 8
+        return make_response(503 if len(timeouts) == 1 else 200)
+
+    fetch.RetryPolicy(base_delay=0, deadline=12, sleep=clock.sleep, clock=clock).call(get, URL)
+    assert timeouts[0] == (5, 12)
+    assert timeouts[1] == (4, 4)
+
+
+def test_other_errors_are_not_retried():
+    clock = Clock()
+    get = FakeGet(requests.exceptions.InvalidURL("bad"))
+    with pytest.raises(requests.exceptions.InvalidURL):
+        policy(clock).call(get, URL)
+    assert get.calls == 1
+
+
+def test_breaker_opens_after_threshold_and_fails_fast():
+    clock = Clock()
+    breaker = fetch.CircuitBreaker(failure_threshold=4, cooldown=300, clock=clock)
+    get = FakeGet(requests.ConnectionError("refused"))
+    with pytest.raises(requests.ConnectionError):
+        policy(clock, breaker=breaker).call(get, URL)
+    assert not breaker.allow(HOST)
+    with pytest.raises(fetch.CircuitOpenError):
+        policy(clock, breaker=breaker).call(get, URL)
+    assert get.calls == 4
+
+
+def test_opening_breaker_stops_retries_with_the_real_error():
+    clock = Clock()
+    breaker = fetch.CircuitBreaker(failure_threshold=2, cooldown=300, clock=clock)
+    error = requests.ConnectionError("refused")
+    get = FakeGet(error)
+    with pytest.raises(requests.ConnectionError) as raised:
+        policy(clock, max_attempts=5, breaker=breaker).call(get, URL)
+    assert raised.value is error
+    assert get.calls == 2
+    # no backoff is slept once the circuit has opened
+    assert len(clock.sleeps) == 1
+
+
+def test_circuit_opened_elsewhere_is_chained_to_the_last_error():
+    clock = Clock()
+    breaker = fetch.CircuitBreaker(failure_threshold=3, cooldown=300, clock=clock)
+    error = requests.ConnectionError("refused")
+
+    def sleep(seconds):
+        # other callers' failures open the circuit during this one's backoff
+        breaker.failure(HOST)
+        breaker.failure(HOST)
+
+    with pytest.raises(fetch.CircuitOpenError) as raised:
+        fetch.RetryPolicy(breaker=breaker, sleep=sleep, clock=clock).call(FakeGet(error), URL)
+    assert raised.value.__cause__ is error
+
+
+def test_breaker_half_open_trial_success_closes_the_circuit():
+    clock = Clock()
+    breaker = fetch.CircuitBreaker(failure_threshold=2, cooldown=300, clock=clock)
+    breaker.failure(HOST)
+    breaker.failure(HOST)
+    with pytest.raises(fetch.CircuitOpenError):
+        breaker.before(HOST)
+    clock.now += 300
+    assert breaker.allow(HOST)
+    # the trial call is let through; later ones wait for its outcome
+    breaker.before(HOST)
+    assert not breaker.allow(HOST)
+    breaker.success(HOST)
+    assert breaker.allow(HOST)
+    breaker.failure(HOST)
+    assert breaker.allow(HOST)
+
+
+def test_breaker_half_open_trial_failure_reopens_the_circuit():
+    clock = Clock()
+    breaker = fetch.CircuitBreaker(failure_threshold=2, cooldown=300, clock=clock)
+    breaker.failure(HOST)
+    breaker.failure(HOST)
+    clock.now += 300
+    breaker.before(HOST)
+    breaker.failure(HOST)
+    clock.now += 299
+    with pytest.raises(fetch.CircuitOpenError):
+        breaker.before(HOST)
+
+
+def test_policy_recovers_through_half_open_breaker():
+    clock = Clock()
+    breaker = fetch.CircuitBreaker(failure_threshold=1, cooldown=300, clock=clock)
+    get = FakeGet(requests.ConnectionError("refused"), make_response(200))
+    with pytest.raises(requests.ConnectionError):
+        policy(clock, breaker=breaker).call(get, URL)
+    clock.now += 300
+    assert policy(clock, breaker=breaker).call(get, URL).status_code == 200
+    assert breaker.allow(HOST)
+    assert breaker.failures == {}
+
+
+def test_breaker_is_per_host():
+    clock = Clock()
+    breaker = fetch.CircuitBreaker(failure_threshold=1, cooldown=300, clock=clock)
+    breaker.failure(HOST)
+    assert not breaker.allow(HOST)
+    assert breaker.allow("other.example.com")
@@ -0,0 +1,88 @@
+import threading
+
+import pytest
+
+import scheduler
+
+
+def job(interval=10, align=True, missed='skip'):
+    return scheduler.Job("test", lambda: None, interval, align=align, missed=missed)
+
+
+def test_unknown_missed_policy_is_rejected():
+    with pytest.raises(ValueError):
+        job(missed='later')
+
+
+def test_next_slot_aligns_to_interval_multiples():
+    assert job().next_slot(100) == 110
+    assert job().next_slot(103.5) == 110
+    assert job(align=False).next_slot(103.5) == 113.5
+
+
+@pytest.mark.parametrize('missed', scheduler.MISSED_POLICIES)
+def test_run_within_its_slot_keeps_the_schedule(missed):
+    assert job(missed=missed).after_run(100, 105) == 110
+
+
+@pytest.mark.parametrize('missed, expected', [
+    ('skip', 140),
+    ('run_once', 130),
+    ('catch_up', 110),
+])
+def test_overrunning_run(missed, expected):
+    # slots 110, 120 and 130 passed while the run took 35 s
+    assert job(missed=missed).after_run(100, 135) == expected
+
+
+@pytest.mark.parametrize('missed, expected', [
+    ('skip', 130),
+    ('run_once', 120),
+    ('catch_up', 110),
+])
+def test_run_ending_exactly_on_a_slot(missed, expected):
+    assert job(missed=missed).after_run(100, 120) == expected
+
+
+def test_unaligned_overrun_counts_from_the_first_slot():
+    assert job(align=False, missed='skip').after_run(103, 131) == 133
+    assert job(align=False, missed='run_once').after_run(103, 131) == 123
+
+
+def test_catch_up_runs_every_missed_slot():
+    catch_up = job(missed='catch_up')
+    slots = [100]
+    while len(slots) < 5:
+        slots.append(catch_up.after_run(slots[-1], 135))
+    assert slots == [100, 110, 120, 130, 140]
+
+
+def test_latest_queue_keeps_only_the_newest_item():
+    queue = scheduler.LatestQueue()
+    queue.put(1)
+    queue.put(2)
+    assert queue.get(timeout=0) == 2
+    with pytest.raises(TimeoutError):
+        queue.get(timeout=0)
+
+
+def test_stage_passes_results_on_and_drops_none():
+    inbox, outbox = scheduler.LatestQueue(), scheduler.LatestQueue()
+    stop = threading.Event()
+    seen = []
+
+    def double(item):
+        seen.append(item)
+        if len(seen) == 2:
+            stop.set()
+        return None if item is None else item * 2
+
+    inbox.put(21)
+    thread = threading.Thread(target=scheduler.Stage("double", double, inbox, outbox).run, args=(stop,))
+    thread.start()
+    assert outbox.get(timeout=5) == 42
+    inbox.put(None)
+    thread.join(5)
+    assert seen == [21, None]
+    with pytest.raises(TimeoutError):
+        outbox.get(timeout=0)
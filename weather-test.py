@@ -1,10 +1,10 @@
-import requests
+import fetch
 import json
 import datetime
 
 # fetch current weather for 55116 from open-meteo API
 
-response = requests.get("https://api.open-meteo.com/v1/forecast", params={
+response = fetch.get("https://api.open-meteo.com/v1/forecast", params={
     "latitude": 44.9833,
     "longitude": -93.2667,
     "wind_speed_unit": "mph",